@@ -0,0 +1,325 @@
+# ASYNCIO MULTI-SESSION TERMINAL SERVER
+# Serves many sessions from one process and one loaded catalogue.
+# Usage:
+#   python3 async_server.py serve --port 8001
+#   python3 async_server.py serve --unix /tmp/cinemate.sock
+#   python3 async_server.py client --port 8001 "5" "1" "the" "n"
+import argparse
+import asyncio
+import codecs
+import os
+import queue
+import resource
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import run
+from session import Session
+
+TERM_COLS = 80
+TERM_ROWS = 24
+# EACH SESSION KEEPS A MENU THREAD BLOCKED ON INPUT WHILE IDLE; ONLY THE
+# STACK PAGES IT TOUCHES ARE RESIDENT (ABOUT 16KB), SO 10,000 IDLE
+# SESSIONS NEED ROUGHLY 160MB. LOWERED TO FIT THE PROCESS'S THREAD
+# LIMITS BY default_max_sessions()
+MAX_SESSIONS = 10000
+# THREADS LEFT FOR THE EVENT LOOP, LOADER, WATCHER AND JOURNAL THREADS
+# AND ANY OTHER PROCESSES COUNTED AGAINST THE SAME LIMIT
+SPARE_THREADS = 64
+# CONTAINER (CGROUP V2, THEN V1) AND SYSTEM-WIDE THREAD LIMITS
+THREAD_LIMIT_FILES = ("/sys/fs/cgroup/pids.max",
+                      "/sys/fs/cgroup/pids/pids.max",
+                      "/proc/sys/kernel/threads-max")
+# MENU THREADS SPEND THEIR TIME BLOCKED ON INPUT, SO A SMALL STACK IS ENOUGH
+THREAD_STACK_SIZE = 512 * 1024
+READ_SIZE = 4096
+
+# TERMINAL CONTROL CHARACTERS
+CTRL_C = "\x03"
+CTRL_D = "\x04"
+BACKSPACE = ("\x7f", "\b")
+ESCAPE = "\x1b"
+
+
+class SessionInput:
+    def __init__(self):
+        """
+        Line input for a session, fed by the connection's coroutine and
+        read by the session's menu thread.
+        """
+        self.lines = queue.Queue()
+
+    def put_line(self, line):
+        self.lines.put(line + "\n")
+
+    def close(self):
+        self.lines.put("")
+
+    def readline(self):
+        """
+        Blocks until the user enters a line.
+
+        Returns:
+            str: Line including its line ending, or "" once closed
+        """
+        line = self.lines.get()
+        if line == "":
+            # KEEP RETURNING EOF TO ANY LATER READS
+            self.lines.put("")
+        return line
+
+
+class SessionOutput:
+    def __init__(self, loop, writer):
+        """
+        Terminal output for a session. Written from the session's menu
+        thread and sent by the event loop, translating line endings as
+        a pty would.
+        """
+        self.loop = loop
+        self.writer = writer
+
+    def write(self, text):
+        data = text.replace("\n", "\r\n").encode("utf-8")
+        self.loop.call_soon_threadsafe(self.send, data)
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def flush(self):
+        pass
+
+
+# FIT THE SESSION CAP TO THE THREADS THIS PROCESS MAY START
+def default_max_sessions():
+    """
+    Returns:
+        int: MAX_SESSIONS, or fewer if the user's process limit
+        (RLIMIT_NPROC, which counts threads) or the container's limit
+        allows fewer threads
+    """
+    limits = [MAX_SESSIONS + SPARE_THREADS]
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NPROC)
+    if soft_limit != resource.RLIM_INFINITY:
+        limits.append(soft_limit)
+    for path in THREAD_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                limits.append(int(f.read()))
+        except (OSError, ValueError):
+            # MISSING, OR "max" FOR NO LIMIT
+            pass
+    return max(1, min(limits) - SPARE_THREADS)
+
+
+class TerminalServer:
+    def __init__(self, max_sessions=None):
+        """
+        Accepts raw terminal connections and runs one session for each
+        against the catalogue already loaded in this process.
+
+        The menus are synchronous, so each session's menu loop runs on
+        a worker thread while a coroutine per connection handles the
+        terminal byte stream: echo, backspace and line buffering.
+
+        Args:
+            max_sessions (int): Most sessions served at once; defaults
+            to default_max_sessions()
+        """
+        self.max_sessions = max_sessions or default_max_sessions()
+        self.sessions = 0
+        self.executor = ThreadPoolExecutor(max_workers=self.max_sessions,
+                                           thread_name_prefix="session")
+
+    async def handle(self, reader, writer):
+        """
+        Runs one session over a connection until either side ends it.
+        """
+        loop = asyncio.get_running_loop()
+        if self.sessions >= self.max_sessions:
+            await refuse(writer)
+            return
+
+        session_input = SessionInput()
+        session = Session(stdin=session_input,
+                          stdout=SessionOutput(loop, writer),
+                          columns=TERM_COLS, rows=TERM_ROWS)
+        self.sessions += 1
+        try:
+            try:
+                menus = loop.run_in_executor(self.executor, run_menus,
+                                             session)
+            except RuntimeError:
+                # NO THREAD COULD BE STARTED, E.G. AT THE CONTAINER'S
+                # THREAD LIMIT; IF THE SESSION RUNS LATER IT SEES EOF
+                session_input.close()
+                await refuse(writer)
+                return
+            keyboard = asyncio.ensure_future(
+                read_keyboard(reader, writer, session_input))
+            try:
+                await asyncio.wait([menus, keyboard],
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                session_input.close()
+                keyboard.cancel()
+                await asyncio.wait([menus])
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve(self, host=None, port=None, path=None):
+        """
+        Loads the catalogue and serves sessions over TCP or a unix
+        socket until cancelled, reloading the catalogue when the dataset
+        changes.
+        """
+        run.load_catalogue()
+        run.start_watching()
+        if path:
+            if os.path.exists(path):
+                os.unlink(path)
+            server = await asyncio.start_unix_server(self.handle, path)
+            where = path
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = f"{host or '*'}:{port}"
+        print(f"CineMate terminal server listening on {where}")
+        sys.stdout.flush()
+        async with server:
+            await server.serve_forever()
+
+
+async def refuse(writer):
+    """
+    Tells a client the server can't take another session and closes
+    the connection.
+    """
+    try:
+        writer.write(b"Server busy, please try again later\r\n")
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def run_menus(session):
+    """
+    Runs a session's menus on a worker thread until its input closes.
+    """
+    try:
+        run.run_session(session)
+    except EOFError:
+        pass
+
+
+async def read_keyboard(reader, writer, session_input):
+    """
+    Reads keystrokes from the connection, echoing them and passing
+    each completed line to the session.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    line = []
+    in_escape = False
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            return
+        echo = []
+        for char in decoder.decode(data):
+            if in_escape:
+                # SKIP ARROW KEYS AND OTHER ESCAPE SEQUENCES
+                if char.isalpha() or char == "~":
+                    in_escape = False
+            elif char == ESCAPE:
+                in_escape = True
+            elif char in ("\r", "\n"):
+                echo.append("\r\n")
+                session_input.put_line("".join(line))
+                line = []
+            elif char in BACKSPACE:
+                if line:
+                    line.pop()
+                    echo.append("\b \b")
+            elif char == CTRL_C or (char == CTRL_D and not line):
+                return
+            elif char.isprintable():
+                line.append(char)
+                echo.append(char)
+        if echo:
+            writer.write("".join(echo).encode("utf-8"))
+
+
+async def scripted_client(host, port, lines, path=None, delay=0.2):
+    """
+    Connects to a server, types each line in turn and returns
+    everything the server sent. For trying the server out locally.
+
+    Args:
+        host (str): Server host
+        port (int): Server port
+        lines (list): Lines to type
+        path (str): Unix socket path to use instead of host and port
+        delay (float): Seconds to wait for output after each line
+
+    Returns:
+        str: Terminal output received
+    """
+    if path:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    output = []
+
+    async def collect():
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                return
+            output.append(data)
+
+    collector = asyncio.ensure_future(collect())
+    await asyncio.sleep(delay)
+    for line in lines:
+        writer.write(line.encode("utf-8") + b"\r")
+        await asyncio.sleep(delay)
+    writer.close()
+    await asyncio.wait([collector], timeout=delay)
+    collector.cancel()
+    return b"".join(output).decode("utf-8", errors="replace")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CineMate asyncio terminal server")
+    parser.add_argument("mode", choices=["serve", "client"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--unix", help="unix socket path instead of TCP")
+    parser.add_argument("--max-sessions", type=int, default=None,
+                        help="most sessions at once (default: fitted to "
+                             "the thread limits)")
+    parser.add_argument("lines", nargs="*",
+                        help="lines to type in client mode")
+    args = parser.parse_intermixed_args()
+
+    if args.mode == "serve":
+        # SET FOR THE WHOLE PROCESS, AS POOL THREADS ARE STARTED AS
+        # SESSIONS ARRIVE; THE DATASET WATCHER AND LIST JOURNAL THREADS
+        # ALSO RUN FINE WITHIN IT
+        threading.stack_size(THREAD_STACK_SIZE)
+        server = TerminalServer(max_sessions=args.max_sessions)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(asyncio.run(scripted_client(args.host, args.port, args.lines,
+                                          path=args.unix)))
+
+
+if __name__ == "__main__":
+    main()
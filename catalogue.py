@@ -0,0 +1,490 @@
+# SHARED MOVIE CATALOGUE
+import contextlib
+import fcntl
+import os
+import threading
+from array import array
+
+from columnar import columns_match, write_store
+from leaderboards import Leaderboards
+from movie_store import MappedMovieStore, MovieList, MovieStore
+from query import QueryEngine
+from recommendations import Recommender
+from search_index import GenreIndex, PrefixIndex, TitleIndex, range_indexes
+from snapshot import file_key, load_snapshot, save_snapshot, snapshot_path
+
+# PARTS OF A CATALOGUE, IN THE ORDER THEY ARE BUILT
+LOAD_STAGES = ("movies", "search", "genres", "ranges", "top", "similar",
+               "query")
+# SNAPSHOT PARTS THE SCREENS OF EACH STAGE USE
+STAGE_PARTS = {
+    "movies": ("store",),
+    "search": ("title_index", "prefix_index"),
+    "genres": ("genre_index",),
+    "ranges": ("numeric_indexes",),
+    "top": ("genre_index", "numeric_indexes", "leaderboards", "top_100"),
+    "similar": ("recommender",),
+    "query": ("title_index", "genre_index", "numeric_indexes",
+              "leaderboards"),
+}
+# OBJECTS USED BY MORE THAN ONE SNAPSHOT PART, AND THE PART EACH IS IN
+SHARED_PARTS = {
+    "store": "store",
+    "title_pool": "title_index",
+    "genre_index": "genre_index",
+    "year_index": "numeric_indexes",
+}
+
+
+class Catalogue:
+    def __init__(self, dataset, columns_dataset=None):
+        """
+        Holds one version of the dataset and everything built from it.
+        Each session uses one catalogue at a time, so a reloaded dataset
+        is swapped in whole by replacing the catalogue, while screens
+        already showing the old one finish with it.
+
+        The parts are built in stages; each part's event in loaded is
+        set once it is ready, so screens can wait for only the parts
+        they use. A catalogue loaded from a snapshot reads each part
+        from it the first time a screen waits for it.
+
+        Args:
+            dataset (str): File path of the tsv dataset
+            columns_dataset (str): File path of the columnar copy of the
+            dataset, used instead of the tsv; built from the tsv when
+            missing or out of date
+
+        Attributes:
+            store (MovieStore): Column store holding the dataset
+            all_movies (MovieList): All movies in dataset order
+            top_100 (MovieList): Top 100 movies by votes, sorted by rating
+            title_index (TitleIndex): Trigram index for title search
+            prefix_index (PrefixIndex): Autocomplete index over the
+            start of each title word
+            genre_index (GenreIndex): Genre catalogue and posting lists
+            numeric_indexes (dict): Sorted indexes for year, runtime,
+            rating and votes
+            leaderboards (Leaderboards): Precomputed top-K lists by
+            genre and year
+            recommender (Recommender): Finds movies similar to others
+            query_engine (QueryEngine): Runs combined searches over all
+            indexes
+            loaded (dict): threading.Event for each of LOAD_STAGES
+            error (Exception): Exception raised while loading, if any
+            snapshot (Snapshot): Snapshot the parts are read from, if
+            loaded from one
+            parts_read (set): Names of the parts read from the snapshot
+        """
+        self.dataset = dataset
+        self.columns_dataset = columns_dataset
+        self.store = None
+        self.all_movies = []
+        self.top_100 = []
+        self.title_index = None
+        self.prefix_index = None
+        self.genre_index = None
+        self.numeric_indexes = None
+        self.leaderboards = None
+        self.recommender = None
+        self.query_engine = None
+        self.loaded = {stage: threading.Event() for stage in LOAD_STAGES}
+        self.error = None
+        self.signature = None
+        self.snapshot = None
+        self.parts_read = set()
+        self.snapshot_lock = threading.RLock()
+
+    def source(self):
+        """
+        Returns:
+            str: File path of the dataset the catalogue is built from:
+            the tsv, or the columnar copy if there is no tsv
+        """
+        if self.columns_dataset and not os.path.exists(self.dataset):
+            return self.columns_dataset
+        return self.dataset
+
+    def source_signature(self):
+        """
+        Returns:
+            tuple: Size, modified time and inode of the tsv and of the
+            columnar copy, which change when either is rewritten, with
+            None for a missing file
+        """
+        signature = []
+        for path in (self.dataset, self.columns_dataset):
+            try:
+                stat = os.stat(path)
+            except (OSError, TypeError):
+                signature.append(None)
+            else:
+                signature.append((stat.st_size, stat.st_mtime_ns,
+                                  stat.st_ino))
+        return tuple(signature)
+
+    def mark_loaded(self, *stages):
+        for stage in stages:
+            self.loaded[stage].set()
+
+    def is_loaded(self, *stages):
+        return all(self.loaded[stage].is_set() for stage in stages)
+
+    def wait(self, *stages):
+        """
+        Blocks until the given parts of the catalogue are ready.
+
+        Raises:
+            Exception: Loading the catalogue failed
+        """
+        for stage in stages:
+            self.loaded[stage].wait()
+        if self.error is not None:
+            raise self.error
+        self.read_parts(*stages)
+
+    # LOAD DATASET AND BUILD EVERYTHING FROM IT
+    def load(self, snapshot_only=False):
+        """
+        Opens the saved snapshot when it matches the source file,
+        otherwise reads the dataset, builds each part in turn and saves
+        a new snapshot. Only the store is read from a snapshot here;
+        wait() reads the other parts as screens need them. Any error is
+        kept in error and re-raised, and every stage is marked so
+        waiting screens are released.
+
+        Builds hold build_lock(), so when several processes load a new
+        dataset at once, one builds it and the others wait and load its
+        snapshot.
+
+        Args:
+            snapshot_only (bool): Only load a snapshot, without
+            building one or rebuilding the columnar copy
+
+        Raises:
+            LookupError: snapshot_only and no up-to-date snapshot
+
+        Returns:
+            Catalogue: This catalogue
+        """
+        try:
+            self.signature = self.source_signature()
+            source = self.source()
+            opened = self.open_snapshot(self.check_columns(rebuild=False))
+            if not opened and snapshot_only:
+                raise LookupError(f"No up-to-date snapshot of {source}")
+            if not opened:
+                with self.build_lock():
+                    # ANOTHER PROCESS MAY HAVE BUILT IT WHILE WE WAITED
+                    use_columns = self.check_columns()
+                    if not self.open_snapshot(use_columns):
+                        # KEY THE DATASET BEFORE READING IT, SO A FILE
+                        # REPLACED DURING THE BUILD NEVER MATCHES THE
+                        # OLDER DATA
+                        key = file_key(source)
+                        self.build(use_columns)
+                        self.create_query_engine()
+                        save_snapshot(source, key, {
+                            "store": self.store,
+                            "top_100": self.top_100.rows,
+                            "title_index": self.title_index,
+                            "prefix_index": self.prefix_index,
+                            "genre_index": self.genre_index,
+                            "numeric_indexes": self.numeric_indexes,
+                            "leaderboards": self.leaderboards,
+                            "recommender": self.recommender,
+                        }, self.shared_objects())
+        except BaseException as error:
+            self.error = error
+            raise
+        finally:
+            self.mark_loaded(*LOAD_STAGES)
+        return self
+
+    @contextlib.contextmanager
+    def build_lock(self):
+        """
+        Holds an exclusive lock on a file next to the snapshot. If the
+        lock file can't be created, e.g. in a read-only directory, no
+        snapshot can be saved either, and the build goes ahead unlocked.
+        """
+        try:
+            lock = open(snapshot_path(self.source()) + ".lock", "a")
+        except OSError:
+            yield
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def open_snapshot(self, use_columns):
+        """
+        Opens the snapshot and reads the store from it.
+
+        Args:
+            use_columns (bool): Whether the columnar copy of the dataset
+            is in use, from check_columns()
+
+        Returns:
+            bool: Whether there is an up-to-date snapshot for the kind
+            of store in use
+        """
+        snapshot = load_snapshot(self.source())
+        if snapshot is None:
+            return False
+        try:
+            store = snapshot.load("store", self.resolve)
+        except Exception:
+            return False
+        # A SNAPSHOT OF THE OTHER KIND OF STORE IS OUT OF DATE
+        if isinstance(store, MappedMovieStore) != use_columns:
+            return False
+        self.snapshot = snapshot
+        self.use_part("store", store)
+        return True
+
+    # READ PARTS OF THE CATALOGUE WHEN FIRST USED
+    def read_parts(self, *stages):
+        """
+        Reads the snapshot parts the given stages use, if they haven't
+        been read yet. Does nothing for a catalogue that was built.
+
+        Args:
+            stages (str): Names from LOAD_STAGES
+        """
+        if self.snapshot is None:
+            return
+        with self.snapshot_lock:
+            for stage in stages:
+                for name in STAGE_PARTS[stage]:
+                    self.read_part(name)
+            if "query" in stages and self.query_engine is None:
+                self.create_query_engine()
+
+    def read_part(self, name):
+        if name not in self.parts_read:
+            self.use_part(name, self.snapshot.load(name, self.resolve))
+
+    def use_part(self, name, value):
+        """
+        Sets the attribute for a part read from the snapshot.
+        """
+        if name == "store":
+            self.store = value
+            self.all_movies = MovieList(value, range(len(value)))
+        elif name == "top_100":
+            self.top_100 = MovieList(self.store, value)
+        else:
+            setattr(self, name, value)
+        self.parts_read.add(name)
+
+    def resolve(self, reference):
+        """
+        Returns:
+            object: The object a reference saved in a snapshot part
+            stands for, reading the part it belongs to first
+        """
+        self.read_part(SHARED_PARTS[reference])
+        if reference == "title_pool":
+            return self.title_index.pool
+        if reference == "year_index":
+            return self.numeric_indexes["year"]
+        return getattr(self, reference)
+
+    def shared_objects(self):
+        """
+        Returns:
+            dict: Maps the reference name of each object in SHARED_PARTS
+            to its part's name and the object, for save_snapshot()
+        """
+        objects = {
+            "store": self.store,
+            "title_pool": self.title_index.pool,
+            "genre_index": self.genre_index,
+            "year_index": self.numeric_indexes["year"],
+        }
+        return {reference: (SHARED_PARTS[reference], obj)
+                for reference, obj in objects.items()}
+
+    def build(self, use_columns=True):
+        """
+        Reads the dataset and builds each part, marking it ready as
+        soon as it is built.
+
+        Args:
+            use_columns (bool): Whether the columnar copy of the dataset
+            can be used, from check_columns()
+        """
+        self.get_movies(use_columns)
+        self.mark_loaded("movies")
+        self.create_title_index()
+        self.create_prefix_index()
+        self.mark_loaded("search")
+        self.create_genre_index()
+        self.mark_loaded("genres")
+        self.create_numeric_indexes()
+        self.mark_loaded("ranges")
+        self.create_leaderboards()
+        self.create_top_100()
+        self.mark_loaded("top")
+        self.create_recommender()
+        self.mark_loaded("similar")
+
+    def check_columns(self, rebuild=True):
+        """
+        Checks that the columnar copy of the dataset was built from the
+        current tsv. A missing or stale copy, or one in an older layout,
+        is built from the tsv.
+
+        Args:
+            rebuild (bool): Build the copy rather than only reporting
+            that it can't be used
+
+        Returns:
+            bool: Whether the columnar copy can be used
+        """
+        if not self.columns_dataset:
+            return False
+        if not os.path.exists(self.dataset):
+            return os.path.exists(self.columns_dataset)
+        try:
+            if columns_match(self.columns_dataset, self.dataset):
+                return True
+        except (OSError, ValueError):
+            # MISSING, OR IN AN OLDER LAYOUT
+            pass
+        if not rebuild:
+            return False
+
+        # KEY THE TSV BEFORE READING IT, AS FOR SNAPSHOTS
+        try:
+            key = file_key(self.dataset)
+            write_store(self.columns_dataset,
+                        MovieStore.from_tsv(self.dataset), key)
+        except OSError:
+            return False
+        return True
+
+    def get_movies(self, use_columns=True):
+        """
+        Reads dataset into a column store and creates a list
+        of all movies backed by it. Memory-maps the columnar copy of the
+        dataset if there is one, otherwise parses the tsv.
+
+        Args:
+            use_columns (bool): Whether the columnar copy of the dataset
+            can be used, from check_columns()
+
+        Returns:
+            MovieList: List of all movies in dataset.
+        """
+        self.store = None
+        if self.columns_dataset and use_columns:
+            try:
+                self.store = MappedMovieStore(self.columns_dataset)
+            except (OSError, ValueError):
+                pass
+        if self.store is None:
+            self.store = MovieStore.from_tsv(self.dataset)
+        self.all_movies = MovieList(self.store, range(len(self.store)))
+        return self.all_movies
+
+    def create_top_100(self):
+        """
+        Creates list of Top 100 movies based on number of votes.
+
+        Returns:
+            MovieList: Top 100 movies by votes, sorted by rating
+        """
+        # GET ONLY TOP 100 WITH MOST VOTES, SORT THEM BY RATING
+        rows = sorted(self.leaderboards.top(100, "votes"),
+                      key=self.store.ratings.__getitem__,
+                      reverse=True)
+        self.top_100 = MovieList(self.store, array("I", rows))
+        return self.top_100
+
+    def create_leaderboards(self):
+        """
+        Precomputes top movies for every ranking, genre and year.
+
+        Returns:
+            Leaderboards: Top-K leaderboards over all movies
+        """
+        self.leaderboards = Leaderboards(self.store, self.genre_index,
+                                         self.numeric_indexes["year"])
+        return self.leaderboards
+
+    def create_recommender(self):
+        """
+        Builds the feature vectors used for recommendations.
+
+        Returns:
+            Recommender: Recommender over all movies
+        """
+        self.recommender = Recommender(self.store)
+        return self.recommender
+
+    def create_title_index(self):
+        """
+        Builds the trigram index used by title search.
+
+        Returns:
+            TitleIndex: Index over all movie titles
+        """
+        self.title_index = TitleIndex(self.store)
+        return self.title_index
+
+    def create_prefix_index(self):
+        """
+        Builds the autocomplete index over title word starts.
+
+        Returns:
+            PrefixIndex: Index over all movie title words
+        """
+        self.prefix_index = PrefixIndex(self.title_index, self.store)
+        return self.prefix_index
+
+    def create_genre_index(self):
+        """
+        Builds the genre catalogue and per-genre posting lists.
+
+        Returns:
+            GenreIndex: Index over all movie genres
+        """
+        self.genre_index = GenreIndex(self.store)
+        return self.genre_index
+
+    def create_numeric_indexes(self):
+        """
+        Builds sorted indexes over year, runtime, rating and votes.
+
+        Returns:
+            dict: RangeIndex for each numeric column
+        """
+        self.numeric_indexes = range_indexes(self.store)
+        return self.numeric_indexes
+
+    def create_query_engine(self):
+        """
+        Combines the indexes for searches over several of them.
+
+        Returns:
+            QueryEngine: Query engine over all indexes
+        """
+        self.query_engine = QueryEngine(self.store, self.title_index,
+                                        self.genre_index,
+                                        self.numeric_indexes,
+                                        self.leaderboards)
+        return self.query_engine
+
+    # FIND A SAVED MOVIE
+    def find_movie(self, key):
+        """
+        Args:
+            key (str or tuple): Key of the movie from Movie.key
+
+        Returns:
+            Movie: The movie, or None if it is not in this catalogue.
+        """
+        row = self.store.find(key)
+        return None if row is None else self.all_movies[row]
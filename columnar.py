@@ -0,0 +1,315 @@
+# COLUMNAR DATASET FILES
+# A typed, self-describing binary copy of the dataset which is memory
+# mapped rather than parsed. Layout:
+#   COLUMNS_MAGIC
+#   source (SOURCE_KEY): columnar version, and the size, modified time
+#   and SHA-256 digest of the tsv the file was built from
+#   header length (4 bytes, little-endian)
+#   header (UTF-8 JSON): row count and, for each column, its name,
+#   encoding, byte offset and length from the start of the data
+#   padding to a multiple of COLUMN_ALIGNMENT bytes
+#   column data, little-endian, each column padded to a multiple of
+#   COLUMN_ALIGNMENT bytes so it can be used in place
+# Column encodings:
+#   "numeric": an array of one typecode ("H", "I", "Q", ...)
+#   "strings": byte offsets (array "I", one more than rows) followed
+#   by all values joined into one UTF-8 string
+#   "bitmask": an array "Q" of bitmasks over a dictionary of names kept
+#   in the header, for multi-valued columns such as genres
+# Usage: python3 columnar.py movie_data.tsv movie_data.columns
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from snapshot import file_key, key_matches
+
+COLUMNS_MAGIC = b"CINEMATE-COLUMNS"
+COLUMNS_VERSION = 3
+SOURCE_KEY = struct.Struct("<IQq32s")
+HEADER_LENGTH = struct.Struct("<I")
+DATA_START = len(COLUMNS_MAGIC) + SOURCE_KEY.size
+COLUMN_ALIGNMENT = 8
+
+
+def padding(length):
+    return b"\0" * (-length % COLUMN_ALIGNMENT)
+
+
+def to_little_endian(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def column_view(typecode, data):
+    """
+    Returns:
+        memoryview: Little-endian column data viewed in place as values
+        of a typecode, or a byte-swapped array copy on big-endian
+        machines
+    """
+    if sys.byteorder == "little":
+        return data.cast(typecode)
+    values = array(typecode)
+    values.frombytes(data)
+    values.byteswap()
+    return values
+
+
+def encode_numeric(typecode, values):
+    """
+    Returns:
+        tuple: Column description and data for a numeric column
+    """
+    return ({"encoding": "numeric", "typecode": typecode},
+            to_little_endian(array(typecode, values)))
+
+
+def encode_strings(values):
+    """
+    Returns:
+        tuple: Column description and data for a text column
+    """
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = array("I", [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    pool = b"".join(encoded)
+    return ({"encoding": "strings",
+             "pool_start": len(offsets) * offsets.itemsize},
+            to_little_endian(offsets) + pool)
+
+
+def encode_bitmask(values, names=None):
+    """
+    Dictionary-encodes a multi-valued column as bitmasks.
+
+    Args:
+        values (list): List of names for each row
+        names (list): Dictionary to start from; extended with new
+        names in order of first appearance
+
+    Returns:
+        tuple: Column description and data for the column
+    """
+    names = list(names or [])
+    ids = {name: number for number, name in enumerate(names)}
+    masks = array("Q")
+    for row_names in values:
+        mask = 0
+        for name in row_names:
+            if name not in ids:
+                if len(names) >= 64:
+                    raise ValueError("Too many distinct values to encode")
+                ids[name] = len(names)
+                names.append(name)
+            mask |= 1 << ids[name]
+        masks.append(mask)
+    return ({"encoding": "bitmask", "dictionary": names},
+            to_little_endian(masks))
+
+
+# WRITE A COLUMNAR FILE
+def write_columns(path, source_key, row_count, columns):
+    """
+    Args:
+        path (str): File path to write
+        source_key (tuple): file_key() of the tsv the columns were
+        read from, taken before reading it
+        row_count (int): Number of rows in every column
+        columns (dict): Maps each column name to a (description, data)
+        pair from one of the encode functions
+    """
+    header = {"rows": row_count, "columns": {}}
+    offset = 0
+    for name, (description, data) in columns.items():
+        header["columns"][name] = dict(description, offset=offset,
+                                       length=len(data))
+        offset += len(data) + len(padding(len(data)))
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_end = DATA_START + HEADER_LENGTH.size + len(header_bytes)
+
+    # WRITE TO A TEMP FILE AND RENAME SO READERS NEVER SEE A PARTIAL FILE
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(COLUMNS_MAGIC)
+        f.write(SOURCE_KEY.pack(COLUMNS_VERSION, *source_key))
+        f.write(HEADER_LENGTH.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(padding(header_end))
+        for description, data in columns.values():
+            f.write(data)
+            f.write(padding(len(data)))
+    os.replace(temp_path, path)
+
+
+def read_source_key(f, path):
+    """
+    Raises:
+        ValueError: Not a columnar file of a supported version
+
+    Returns:
+        tuple: Source key stored at the start of an open columnar file
+    """
+    start = f.read(DATA_START)
+    if not start.startswith(COLUMNS_MAGIC) or len(start) < DATA_START:
+        raise ValueError(f"{path} is not a columnar dataset")
+    version, *key = SOURCE_KEY.unpack_from(start, len(COLUMNS_MAGIC))
+    if version != COLUMNS_VERSION:
+        raise ValueError(f"Unsupported columnar dataset version in {path}")
+    return key
+
+
+# CHECK A COLUMNAR FILE AGAINST ITS TSV
+def columns_match(path, dataset):
+    """
+    Checks whether a columnar file was built from the current version
+    of a tsv dataset. If only the tsv's modified time has changed, the
+    key in the columnar file is updated so later checks don't hash the
+    tsv again.
+
+    Args:
+        path (str): File path of the columnar file
+        dataset (str): File path of the tsv dataset
+
+    Raises:
+        OSError: Columnar file can't be read
+        ValueError: Not a columnar file of a supported version
+
+    Returns:
+        bool: Whether the columnar file matches the tsv
+    """
+    with open(path, "rb") as f:
+        key = read_source_key(f, path)
+    matches, current = key_matches(key, dataset)
+    if current is not None:
+        try:
+            with open(path, "r+b") as f:
+                # THE KEY HAS A FIXED SIZE, SO IT IS REWRITTEN IN PLACE
+                os.pwrite(f.fileno(),
+                          SOURCE_KEY.pack(COLUMNS_VERSION, *current),
+                          len(COLUMNS_MAGIC))
+        except OSError:
+            pass
+    return matches
+
+
+# MAP A COLUMNAR FILE
+def map_columns(path, names=None):
+    """
+    Memory-maps a columnar file and views its columns in place, so
+    opening it takes the same time whatever its size. Pages are read
+    from disk on first access and shared through the page cache by
+    every process that maps the same file.
+
+    Args:
+        path (str): File path to map
+        names (list): Columns to view; defaults to all
+
+    Raises:
+        ValueError: Not a columnar file of a supported version
+        KeyError: Requested column not in the file
+
+    Returns:
+        tuple: Row count, and a dict mapping each column name to a
+        memoryview for numeric columns, a (UTF-8 bytes, byte offsets)
+        pair for text columns, or a (masks, dictionary) pair for
+        bitmask columns
+    """
+    with open(path, "rb") as f:
+        read_source_key(f, path)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    (header_length,) = HEADER_LENGTH.unpack_from(view, DATA_START)
+    header_start = DATA_START + HEADER_LENGTH.size
+    header_end = header_start + header_length
+    header = json.loads(bytes(view[header_start:header_end]))
+    data_start = header_end + len(padding(header_end))
+
+    columns = {}
+    for name in names or header["columns"]:
+        description = header["columns"][name]
+        start = data_start + description["offset"]
+        data = view[start:start + description["length"]]
+        encoding = description["encoding"]
+        if encoding == "numeric":
+            columns[name] = column_view(description["typecode"], data)
+        elif encoding == "strings":
+            pool_start = description["pool_start"]
+            columns[name] = (data[pool_start:],
+                             column_view("I", data[:pool_start]))
+        elif encoding == "bitmask":
+            columns[name] = (column_view("Q", data),
+                             description["dictionary"])
+        else:
+            raise ValueError(f"Unknown column encoding {encoding!r}")
+    return header["rows"], columns
+
+
+# CONVERT A TSV DATASET
+def write_catalogue(path, source_key, titles, years, runtimes, genres,
+                    ratings, votes, tconsts=None):
+    """
+    Writes the dataset's columns in the layout MappedMovieStore
+    reads.
+
+    Args:
+        path (str): File path to write
+        source_key (tuple): file_key() of the tsv the columns were
+        read from, taken before reading it
+        titles (list): Movie titles
+        years (list): Release years
+        runtimes (list): Runtimes in minutes
+        genres (list): List of genre names for each movie
+        ratings (list): Average ratings in tenths (e.g. 87 for 8.7)
+        votes (list): Numbers of votes
+        tconsts (list): Numbers of the movies' IMDb IDs (e.g. 111161
+        for tt0111161); the column is left out if not given
+    """
+    columns = {
+        "title": encode_strings(titles),
+        "year": encode_numeric("H", years),
+        "runtime": encode_numeric("H", runtimes),
+        "genres": encode_bitmask(genres),
+        "rating": encode_numeric("H", ratings),
+        "votes": encode_numeric("I", votes),
+    }
+    if tconsts is not None:
+        columns["tconst"] = encode_numeric("I", tconsts)
+    write_columns(path, source_key, len(titles), columns)
+
+
+def write_store(path, store, source_key):
+    """
+    Writes the columns of a MovieStore read from a tsv.
+
+    Args:
+        path (str): File path to write
+        store (MovieStore): Store read from the tsv
+        source_key (tuple): file_key() of the tsv, taken before reading
+        it
+    """
+    write_catalogue(
+        path,
+        source_key,
+        [store.title(row) for row in range(len(store))],
+        store.years,
+        store.runtimes,
+        [store.genres(row) for row in range(len(store))],
+        store.ratings,
+        store.votes,
+        store.tconsts,
+    )
+
+
+if __name__ == "__main__":
+    from movie_store import MovieStore
+
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python3 columnar.py DATASET.tsv OUTPUT.columns")
+    tsv_key = file_key(sys.argv[1])
+    write_store(sys.argv[2], MovieStore.from_tsv(sys.argv[1]), tsv_key)
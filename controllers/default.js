@@ -1,13 +1,71 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const { spawn } = require('child_process');
+
+// Set CINEMATE_SOCKET to serve sessions from a pre-loaded Python
+// process (session_server.py) instead of spawning run.py per connection
+const SESSION_SOCKET = process.env.CINEMATE_SOCKET;
+// Set CINEMATE_SERVER to "async" to serve those sessions from a single
+// asyncio process (async_server.py) instead of forking one per session
+const SESSION_SERVER = process.env.CINEMATE_SERVER === 'async'
+    ? ['async_server.py', 'serve', '--unix', SESSION_SOCKET]
+    : ['session_server.py', SESSION_SOCKET];
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    if (SESSION_SOCKET) {
+        startSessionServer();
+    }
+
 };
 
+function startSessionServer() {
+
+    const server = spawn('python3', SESSION_SERVER, {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
+
+    server.on('exit', function (code, signal) {
+        console.log("Session server exited, restarting");
+        setTimeout(startSessionServer, 1000);
+    });
+
+}
+
+// Connect to the session server and wrap the socket so it can be
+// used in place of a pty
+function connectSession() {
+
+    const conn = net.connect(SESSION_SOCKET);
+    // Emit decoded strings like node-pty, so multi-byte characters
+    // split across reads are not sent as broken frames
+    conn.setEncoding('utf8');
+
+    return {
+        on: function (event, listener) {
+            if (event === 'exit') {
+                conn.on('close', listener);
+                conn.on('error', function () {});
+            } else {
+                conn.on(event, listener);
+            }
+        },
+        write: function (data) {
+            conn.write(data);
+        },
+        kill: function () {
+            conn.destroy();
+        }
+    };
+
+}
+
 function socket() {
 
     this.encodedecode = false;
@@ -15,14 +73,18 @@ function socket() {
 
     this.on('open', function (client) {
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
-            name: 'xterm-color',
-            cols: 80,
-            rows: 24,
-            cwd: process.env.PWD,
-            env: process.env
-        });
+        // Spawn terminal, or fork a pre-loaded session if enabled
+        if (SESSION_SOCKET) {
+            client.tty = connectSession();
+        } else {
+            client.tty = Pty.spawn('python3', ['run.py'], {
+                name: 'xterm-color',
+                cols: 80,
+                rows: 24,
+                cwd: process.env.PWD,
+                env: process.env
+            });
+        }
 
         client.tty.on('exit', function (code, signal) {
             client.tty = null;
@@ -1,52 +1,553 @@
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
+from columnar import write_catalogue
+from snapshot import file_key
+
 # CHOOSE PATH FOR NEW TSV OUTPUT
 OUTPUT_PATH = '/Users/carl.murray/Documents/cinemate-pp3/movie_data.tsv'
 
-# OPEN IMDB TSV FILES
-df_basics = pd.read_table('title.basics.tsv', low_memory=False)
-df_ratings = pd.read_table('title.ratings.tsv', low_memory=False)
-
-# REMOVE UNUSED COLUMNS
-df_basics.drop(columns=['endYear', 'isAdult', 'originalTitle'], inplace=True)
+# IMDB TSV FILES
+BASICS_PATH = 'title.basics.tsv'
+RATINGS_PATH = 'title.ratings.tsv'
 
-# FILTER DATA - MOVIES ONLY, MUST HAVE VALID DATA
-df_basics = df_basics.loc[
-    (df_basics['titleType'] == 'movie') &
-    (df_basics['runtimeMinutes'] != '\\N') &
-    (df_basics['genres'] != '\\N') &
-    (df_basics['startYear'] != '\\N')
-]
+# INCREMENTAL MODE - PREVIOUS BUILD AND LOG OF CHANGES TO THE OUTPUT
+STATE_PATH = 'movie_data.state'
+CHANGES_PATH = 'movie_data.changes.json'
 
-# CONVERT COLUMNS TO INT
-df_basics['startYear'] = df_basics['startYear'].astype(int)
-df_basics['runtimeMinutes'] = df_basics['runtimeMinutes'].astype(int)
+# SELECTION CRITERIA
+MIN_RUNTIME = 90
+MIN_YEAR = 2000
+MIN_VOTES = 50000
+MIN_RATING = 7.0
+TOP_N = 1000  # NUMBER OF MOVIES KEPT, BY MOST VOTES
 
-# FILTER BY DATE AND RUNTIME
-df_basics = df_basics.loc[
-    (df_basics['runtimeMinutes'] >= 90) &
-    (df_basics['startYear'] >= 2000)
-]
-
-# MERGE TSVs - ONLY MOVIES WITH RATINGS INCLUDED
-combined = pd.merge(df_basics, df_ratings, on='tconst')
+# ROWS OF title.basics.tsv READ AT A TIME IN STREAMING MODE
+CHUNK_SIZE = 200000
+# BYTES OF title.basics.tsv EACH WORKER READS AT A TIME IN PARALLEL MODE
+RANGE_SIZE = 32 * 1024 * 1024
 
 # DEFINE OUTPUT COLUMNS
-columns = ['primaryTitle', 'startYear', 'runtimeMinutes',
+columns = ['tconst', 'primaryTitle', 'startYear', 'runtimeMinutes',
            'genres', 'averageRating', 'numVotes']
 
-# SET RATING AND VOTES CRITERIA
-combined = combined.loc[
-    (combined['numVotes'] > 50000) &
-    (combined['averageRating'] >= 7.0)
-]
+# COLUMNS AND TYPES READ IN STREAMING MODE. YEAR AND RUNTIME ARE READ
+# AS TEXT AND CONVERTED AFTER FILTERING, AS A FEW ROWS OF THE DUMP
+# HAVE NON-NUMERIC VALUES IN THESE COLUMNS
+BASICS_DTYPES = {
+    'tconst': 'string',
+    'titleType': 'category',
+    'primaryTitle': 'string',
+    'startYear': 'string',
+    'runtimeMinutes': 'string',
+    'genres': 'string',
+}
+RATINGS_DTYPES = {
+    'tconst': 'string',
+    'averageRating': 'float64',
+    'numVotes': 'int64',
+}
+
+
+# BUILD DATASET BY LOADING BOTH FILES IN FULL
+def build_full(basics_path=BASICS_PATH, ratings_path=RATINGS_PATH):
+    """
+    Loads both IMDB files into memory, then filters and merges them.
+
+    Returns:
+        DataFrame: Top movies by number of votes
+    """
+    # OPEN IMDB TSV FILES
+    df_basics = pd.read_table(basics_path, low_memory=False,
+                              keep_default_na=False)
+    df_ratings = pd.read_table(ratings_path, low_memory=False,
+                               keep_default_na=False)
+
+    # REMOVE UNUSED COLUMNS
+    df_basics.drop(columns=['endYear', 'isAdult', 'originalTitle'],
+                   inplace=True)
+
+    # FILTER DATA - MOVIES ONLY, MUST HAVE VALID DATA
+    df_basics = df_basics.loc[
+        (df_basics['titleType'] == 'movie') &
+        (df_basics['runtimeMinutes'] != '\\N') &
+        (df_basics['genres'] != '\\N') &
+        (df_basics['startYear'] != '\\N')
+    ]
+
+    # CONVERT COLUMNS TO INT
+    df_basics['startYear'] = df_basics['startYear'].astype(int)
+    df_basics['runtimeMinutes'] = df_basics['runtimeMinutes'].astype(int)
+
+    # FILTER BY DATE AND RUNTIME
+    df_basics = df_basics.loc[
+        (df_basics['runtimeMinutes'] >= MIN_RUNTIME) &
+        (df_basics['startYear'] >= MIN_YEAR)
+    ]
+
+    # MERGE TSVs - ONLY MOVIES WITH RATINGS INCLUDED
+    combined = pd.merge(df_basics, df_ratings, on='tconst')
+
+    # SET RATING AND VOTES CRITERIA
+    combined = combined.loc[
+        (combined['numVotes'] > MIN_VOTES) &
+        (combined['averageRating'] >= MIN_RATING)
+    ]
+
+    # SORT BY NUMVOTES
+    combined = combined.sort_values(by=['numVotes'], ascending=False)
+
+    # TRIM TO TOP MOVIES
+    return combined.head(TOP_N)
+
+
+# READ RATINGS THAT MEET THE CRITERIA
+def read_ratings(ratings_path=RATINGS_PATH, filtered=True):
+    """
+    Reads the ratings file, keeping only titles with enough votes and
+    a high enough rating. The result is small enough to keep in memory
+    while title.basics.tsv is streamed.
+
+    Args:
+        filtered (bool): False to keep every title's rating
+
+    Returns:
+        DataFrame: tconst, averageRating and numVotes of qualifying titles
+    """
+    ratings = pd.read_table(ratings_path, dtype=RATINGS_DTYPES,
+                            na_values='\\N', keep_default_na=False,
+                            quoting=csv.QUOTE_NONE)
+    if not filtered:
+        return ratings
+    return ratings.loc[
+        (ratings['numVotes'] > MIN_VOTES) &
+        (ratings['averageRating'] >= MIN_RATING)
+    ]
+
+
+# FILTER ONE CHUNK OF title.basics.tsv
+def filter_basics(chunk):
+    """
+    Keeps movies from a chunk of title.basics.tsv that have a year,
+    runtime and genres and meet the year and runtime criteria.
+
+    Args:
+        chunk (DataFrame): Rows read with BASICS_DTYPES
+
+    Returns:
+        DataFrame: Matching movies with integer year and runtime
+    """
+    chunk = chunk.loc[(chunk['titleType'] == 'movie') &
+                      chunk['genres'].notna()]
+    chunk = chunk.assign(
+        startYear=pd.to_numeric(chunk['startYear'], errors='coerce'),
+        runtimeMinutes=pd.to_numeric(chunk['runtimeMinutes'],
+                                     errors='coerce'),
+    )
+    chunk = chunk.loc[(chunk['runtimeMinutes'] >= MIN_RUNTIME) &
+                      (chunk['startYear'] >= MIN_YEAR)]
+    return chunk.astype({'startYear': 'int64', 'runtimeMinutes': 'int64'})
+
+
+# KEEP THE TOP MOVIES SEEN SO FAR
+def keep_top(top, matches, top_n=TOP_N):
+    """
+    Merges newly matched movies into the running top N by votes. Ties
+    keep the order the movies were read in.
+
+    Returns:
+        DataFrame: At most top_n movies, most votes first
+    """
+    combined = pd.concat([top, matches]) if top is not None else matches
+    combined = combined.sort_values(by=['numVotes'], ascending=False,
+                                    kind='stable')
+    return combined.head(top_n)
+
+
+# BUILD DATASET BY STREAMING title.basics.tsv IN CHUNKS
+def build_streaming(basics_path=BASICS_PATH, ratings_path=RATINGS_PATH,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Reads title.basics.tsv a chunk at a time, reading only the needed
+    columns with explicit types. Each chunk is filtered and joined to
+    the qualifying ratings before it is kept, and only a running top N
+    is held, so memory use depends on the chunk size and output size
+    rather than on the size of the dump.
+
+    Returns:
+        DataFrame: Top movies by number of votes
+    """
+    ratings = read_ratings(ratings_path)
+
+    top = None
+    chunks = pd.read_table(basics_path, usecols=list(BASICS_DTYPES),
+                           dtype=BASICS_DTYPES, na_values='\\N',
+                           keep_default_na=False, quoting=csv.QUOTE_NONE,
+                           chunksize=chunk_size)
+    for chunk in chunks:
+        matches = filter_basics(chunk).merge(ratings, on='tconst')
+        if len(matches):
+            top = keep_top(top, matches)
+
+    if top is None:
+        return pd.DataFrame(columns=columns)
+    return top
+
+
+# SPLIT A FILE INTO RANGES OF WHOLE LINES
+def byte_ranges(path, range_size=RANGE_SIZE):
+    """
+    Splits a TSV file after its header into byte ranges that each start
+    and end on a line boundary.
+
+    Returns:
+        tuple: Header column names, and a list of (start, end) offsets
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as file:
+        header = file.readline().decode('utf-8').rstrip('\r\n').split('\t')
+        start = file.tell()
+        while start < size:
+            file.seek(min(start + range_size, size))
+            file.readline()
+            end = min(file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+# FILTER ONE BYTE RANGE OF title.basics.tsv
+def filter_basics_range(path, header, start, end):
+    """
+    Runs in a worker process. Parses one range of title.basics.tsv and
+    filters it like a streamed chunk.
+
+    Returns:
+        DataFrame: Matching movies in the range
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    chunk = pd.read_table(io.BytesIO(data), header=None, names=header,
+                          usecols=list(BASICS_DTYPES), dtype=BASICS_DTYPES,
+                          na_values='\\N', keep_default_na=False,
+                          quoting=csv.QUOTE_NONE)
+    return filter_basics(chunk)
+
+
+# BUILD DATASET ACROSS A POOL OF PROCESSES
+def build_parallel(basics_path=BASICS_PATH, ratings_path=RATINGS_PATH,
+                   workers=None, range_size=RANGE_SIZE):
+    """
+    Parses the ratings file while worker processes parse and filter
+    ranges of title.basics.tsv, then joins the filtered movies to the
+    ratings with a hash lookup on tconst.
+
+    Args:
+        workers (int): Number of processes; defaults to the CPU count
+        range_size (int): Bytes of title.basics.tsv per task
+
+    Returns:
+        DataFrame: Top movies by number of votes
+    """
+    header, ranges = byte_ranges(basics_path, range_size)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        ratings = pool.submit(read_ratings, ratings_path)
+        parts = [pool.submit(filter_basics_range, basics_path, header,
+                             start, end)
+                 for start, end in ranges]
+        # COLLECTED IN FILE ORDER SO TIES KEEP THE ORDER OF THE DUMP
+        basics = [part.result() for part in parts]
+        ratings = ratings.result()
 
-# SORT BY NUMVOTES
-combined = combined.sort_values(by=['numVotes'], ascending=False)
+    # HASH JOIN AGAINST THE MUCH SMALLER RATINGS TABLE
+    ratings = ratings.set_index('tconst')
+    top = None
+    for movies in basics:
+        matches = movies.join(ratings, on='tconst', how='inner')
+        if len(matches):
+            top = keep_top(top, matches)
+
+    if top is None:
+        return pd.DataFrame(columns=columns)
+    return top
+
+
+# READ EVERY MOVIE THAT MEETS THE title.basics.tsv CRITERIA
+def eligible_movies(basics_path=BASICS_PATH, ratings=None, exclude=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Streams title.basics.tsv and keeps every movie meeting the type,
+    year and runtime criteria, whatever its rating, with its current
+    rating attached if it has one.
+
+    Args:
+        ratings (DataFrame): Every title's rating, from read_ratings
+        exclude (Index): tconsts to skip, e.g. movies already known
+
+    Returns:
+        tuple: Movies indexed by tconst, in file order, and the
+        tconst_ids of every rated title in the file, eligible or not
+    """
+    parts = []
+    seen = []
+    rated = pd.Index(ratings['tconst'])
+    chunks = pd.read_table(basics_path, usecols=list(BASICS_DTYPES),
+                           dtype=BASICS_DTYPES, na_values='\\N',
+                           keep_default_na=False, quoting=csv.QUOTE_NONE,
+                           chunksize=chunk_size)
+    for chunk in chunks:
+        seen.append(tconst_ids(
+            chunk.loc[chunk['tconst'].isin(rated), 'tconst']))
+        if exclude is not None:
+            chunk = chunk.loc[~chunk['tconst'].isin(exclude)]
+        parts.append(filter_basics(chunk).drop(columns=['titleType']))
+
+    movies = pd.concat(parts).set_index('tconst')[columns[1:5]]
+    movies = movies.join(ratings.set_index('tconst'), how='left')
+    return (movies.astype({'numVotes': 'Int64'}),
+            pd.Index(pd.concat(seen), dtype='int64'))
+
+
+def tconst_ids(tconsts):
+    """
+    Returns:
+        Series: Number of each tconst (e.g. 111161 for tt0111161), which
+        is smaller to keep than the text
+    """
+    return tconsts.str.slice(2).astype('int64')
+
+
+# PICK THE TOP MOVIES FROM ALL ELIGIBLE MOVIES
+def select_top(movies, top_n=TOP_N):
+    """
+    Returns:
+        DataFrame: The top_n movies meeting the rating criteria, most
+        votes first
+    """
+    qualifying = ((movies['numVotes'] > MIN_VOTES) &
+                  (movies['averageRating'] >= MIN_RATING)).fillna(False)
+    top = movies.loc[qualifying].sort_values(by=['numVotes'],
+                                             ascending=False, kind='stable')
+    return top.head(top_n).astype({'numVotes': 'int64'})
+
+
+def differs(new, old):
+    same = (new == old).fillna(False) | (new.isna() & old.isna())
+    return ~same
+
+
+# APPLY A NEW RATINGS FILE TO THE PREVIOUS BUILD
+def apply_ratings(movies, ratings):
+    """
+    Updates the rating and votes of movies whose ratings changed.
+
+    Args:
+        movies (DataFrame): Eligible movies indexed by tconst; changed
+        in place
+        ratings (DataFrame): Every title's rating, from read_ratings
+
+    Returns:
+        int: Number of movies changed
+    """
+    new = ratings.set_index('tconst').reindex(movies.index)
+    new = new.astype({'numVotes': 'Int64'})
+    changed = (differs(new['numVotes'], movies['numVotes']) |
+               differs(new['averageRating'], movies['averageRating']))
+    movies.loc[changed, ['averageRating', 'numVotes']] = new.loc[
+        changed, ['averageRating', 'numVotes']]
+    return int(changed.sum())
+
+
+# LIST CHANGES BETWEEN TWO BUILDS
+def describe_changes(old_top, new_top):
+    """
+    Lists movies added to, removed from or updated in the output.
+
+    Returns:
+        list: One dict per changed movie
+    """
+    def entry(change, row):
+        return {
+            'change': change,
+            'tconst': row.name,
+            'title': row['primaryTitle'],
+            'year': int(row['startYear']),
+            'rating': float(row['averageRating']),
+            'votes': int(row['numVotes']),
+        }
+
+    changes = []
+    for tconst, row in new_top.iterrows():
+        if tconst not in old_top.index:
+            changes.append(entry('added', row))
+        elif (row['numVotes'] != old_top.at[tconst, 'numVotes'] or
+              row['averageRating'] != old_top.at[tconst, 'averageRating']):
+            changes.append(entry('updated', row))
+    for tconst, row in old_top.iterrows():
+        if tconst not in new_top.index:
+            changes.append(entry('removed', row))
+    return changes
+
+
+def basics_signature(basics_path):
+    stat = os.stat(basics_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# REFRESH THE PREVIOUS BUILD WITH NEW IMDB FILES
+def build_incremental(basics_path=BASICS_PATH, ratings_path=RATINGS_PATH,
+                      state_path=STATE_PATH, chunk_size=CHUNK_SIZE):
+    """
+    Refreshes the previous build instead of rebuilding from scratch.
+
+    The state file keeps every movie that meets the title.basics.tsv
+    criteria with its last known rating, and the tconst of every rated
+    title seen in title.basics.tsv. Each run reads the ratings file,
+    updates only the movies whose ratings changed and picks the top
+    movies again. title.basics.tsv is only read again when it has
+    changed since it was last read and a newly qualifying rating
+    belongs to a title never seen in it, such as a new release, and
+    then only titles not already known are kept. Ratings of TV series,
+    episodes or older films, which were seen but are not eligible, do
+    not cause a read. Changes to the titles, years or genres of known
+    movies need a full build.
+
+    The first run, with no state file, reads everything.
+
+    Returns:
+        tuple: Top movies by number of votes, and a list of changes to
+        the output since the previous build
+    """
+    ratings = read_ratings(ratings_path, filtered=False)
+    try:
+        state = pd.read_pickle(state_path)
+    except FileNotFoundError:
+        state = None
+
+    if state is None:
+        signature = basics_signature(basics_path)
+        movies, seen = eligible_movies(basics_path, ratings,
+                                       chunk_size=chunk_size)
+        old_top = select_top(movies.iloc[:0])
+    else:
+        movies, signature = state['movies'], state['basics']
+        # STATE FROM BEFORE SEEN TITLES WERE KEPT READS THE FILE ONCE
+        seen = state.get('seen', pd.Index([], dtype='int64'))
+        old_top = select_top(movies)
+        apply_ratings(movies, ratings)
+
+        # QUALIFYING RATINGS FOR TITLES NEVER SEEN IN title.basics.tsv
+        qualifying = ratings.loc[(ratings['numVotes'] > MIN_VOTES) &
+                                 (ratings['averageRating'] >= MIN_RATING),
+                                 'tconst']
+        unknown = (~qualifying.isin(movies.index) &
+                   ~tconst_ids(qualifying).isin(seen))
+        current = basics_signature(basics_path)
+        if unknown.any() and current != signature:
+            new_movies, seen = eligible_movies(basics_path, ratings,
+                                               exclude=movies.index,
+                                               chunk_size=chunk_size)
+            movies = pd.concat([movies, new_movies])
+            signature = current
+
+    # WRITE NEW STATE ATOMICALLY
+    temp_path = state_path + '.tmp'
+    pd.to_pickle({'basics': signature, 'movies': movies, 'seen': seen},
+                 temp_path)
+    os.replace(temp_path, state_path)
+
+    top = select_top(movies)
+    return top.reset_index(), describe_changes(old_top, top)
+
+
+# OUTPUT LIST OF CHANGES
+def write_changes(changes, changes_path=CHANGES_PATH):
+    """
+    Writes the changes of an incremental build as JSON, for running
+    servers to pick up.
+    """
+    with open(changes_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'built': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'changes': changes,
+        }, file, indent=1)
 
-# TRIM TO TOP 1000 MOVIES
-combined = combined.head(1000)
 
 # OUTPUT TO NEW TSV FILE
-combined.to_csv(OUTPUT_PATH, sep='\t', header=True,
-                index=False, columns=columns)
+def write_tsv(combined, output_path=OUTPUT_PATH):
+    combined.to_csv(output_path, sep='\t', header=True,
+                    index=False, columns=columns)
+
+
+# OUTPUT TYPED COLUMNAR COPY FOR FAST LOADING
+def write_columnar(combined, columns_path, output_path=OUTPUT_PATH):
+    """
+    Writes the output as a columnar file that run.py loads without
+    parsing text, with genres dictionary-encoded. The file records the
+    tsv written to output_path, so run.py can tell when it is stale.
+    """
+    write_catalogue(
+        columns_path,
+        file_key(output_path),
+        combined['primaryTitle'].tolist(),
+        combined['startYear'].tolist(),
+        combined['runtimeMinutes'].tolist(),
+        [genres.split(',') for genres in combined['genres']],
+        (combined['averageRating'] * 10).round().astype(int).tolist(),
+        combined['numVotes'].tolist(),
+        tconst_ids(combined['tconst']).tolist(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the CineMate dataset from IMDB TSV files')
+    parser.add_argument('--basics', default=BASICS_PATH)
+    parser.add_argument('--ratings', default=RATINGS_PATH)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--columns', default=None,
+                        help='columnar output path (default: output path '
+                             'with a .columns extension)')
+    parser.add_argument('--stream', action='store_true',
+                        help='read title.basics.tsv in chunks to bound '
+                             'memory use')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--parallel', action='store_true',
+                        help='parse and filter across a pool of processes')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes in parallel mode '
+                             '(default: number of CPUs)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='refresh the previous build from a state file')
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--changes', default=CHANGES_PATH)
+    args = parser.parse_args()
+
+    if args.incremental:
+        combined, changes = build_incremental(args.basics, args.ratings,
+                                              args.state, args.chunk_size)
+        write_changes(changes, args.changes)
+    elif args.parallel:
+        combined = build_parallel(args.basics, args.ratings, args.workers)
+    elif args.stream:
+        combined = build_streaming(args.basics, args.ratings,
+                                   args.chunk_size)
+    else:
+        combined = build_full(args.basics, args.ratings)
+    write_tsv(combined, args.output)
+    write_columnar(combined, args.columns
+                   or os.path.splitext(args.output)[0] + '.columns',
+                   args.output)
+
+
+if __name__ == '__main__':
+    main()
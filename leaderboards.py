@@ -0,0 +1,136 @@
+# TOP-K LEADERBOARDS
+import heapq
+from array import array
+
+# RANKING KEYS ACCEPTED BY Leaderboards.top
+RANKINGS = {
+    "votes": "Most votes",
+    "rating": "Highest rating",
+    "weighted": "Weighted rating",
+}
+# NUMBER OF MOVIES PRECOMPUTED FOR EACH GENRE AND YEAR LEADERBOARD
+PRECOMPUTE_K = 100
+
+
+class Leaderboards:
+    def __init__(self, store, genre_index, year_index, min_votes=None,
+                 precompute_k=PRECOMPUTE_K):
+        """
+        Builds top-K movie lists for any ranking, precomputing the
+        leaderboards for every genre and every year.
+
+        The weighted rating is IMDb's formula, which pulls the rating
+        of movies with few votes towards the mean rating:
+        (v / (v + m)) * R + (m / (v + m)) * C
+
+        Args:
+            store (MovieStore): Store holding the movies' data
+            genre_index (GenreIndex): Genre posting lists of the store
+            year_index (RangeIndex): Year index of the store
+            min_votes (int): m in the weighted rating formula; defaults
+            to the median number of votes
+            precompute_k (int): Length of precomputed leaderboards
+        """
+        self.store = store
+        self.genre_index = genre_index
+        self.year_index = year_index
+        self.precompute_k = precompute_k
+
+        count = len(store)
+        votes = store.votes
+        ratings = store.ratings
+        if min_votes is None:
+            min_votes = sorted(votes)[count // 2] if count else 0
+        mean_rating = sum(ratings) / 10 / count if count else 0
+        self.min_votes = min_votes
+        self.weighted = array("d", (
+            (votes[row] * ratings[row] / 10 + min_votes * mean_rating)
+            / (votes[row] + min_votes or 1)
+            for row in range(count)
+        ))
+
+        # PRECOMPUTED LEADERBOARDS KEYED ON (RANKING, FACET, VALUE)
+        self.cache = {}
+        for ranking in RANKINGS:
+            self.cache[(ranking, None, None)] = self.select(
+                precompute_k, ranking, range(count))
+            for genre in genre_index.names:
+                self.cache[(ranking, "genre", genre)] = self.select(
+                    precompute_k, ranking, genre_index.rows(genre))
+            for year in sorted(set(year_index.values)):
+                self.cache[(ranking, "year", year)] = self.select(
+                    precompute_k, ranking, self.year_rows(year))
+
+    def key(self, ranking):
+        """
+        Returns:
+            function: Sort key mapping a row number to its score.
+
+        Raises:
+            KeyError: Unknown ranking
+        """
+        return {
+            "votes": self.store.votes.__getitem__,
+            "rating": self.store.ratings.__getitem__,
+            "weighted": self.weighted.__getitem__,
+        }[ranking]
+
+    def year_rows(self, year):
+        """
+        Returns:
+            list: Ascending row numbers of movies released in the year.
+        """
+        return sorted(self.year_index.between(year, year))
+
+    def select(self, k, ranking, rows):
+        """
+        Picks the top k rows with a heap rather than a full sort.
+        Ties keep the order of the given rows.
+
+        Returns:
+            array: Row numbers of the top k movies, best first.
+        """
+        return array("I", heapq.nlargest(k, rows, key=self.key(ranking)))
+
+    def top(self, k, ranking="votes", genre=None, year=None):
+        """
+        Returns the top k movies by a ranking, optionally within a
+        genre or a year. Served from the precomputed leaderboards when
+        k is no more than their length.
+
+        Args:
+            k (int): Number of movies
+            ranking (str): One of the keys of RANKINGS
+            genre (str): Only include movies in this genre
+            year (int): Only include movies released in this year
+
+        Returns:
+            array: Row numbers of the top k movies, best first.
+
+        Raises:
+            KeyError: Unknown ranking or genre
+        """
+        if genre is not None and year is not None:
+            rows = [row for row in self.genre_index.rows(genre)
+                    if self.store.years[row] == year]
+            return self.select(k, ranking, rows)
+
+        if genre is not None:
+            facet = ("genre", genre)
+        elif year is not None:
+            facet = ("year", year)
+        else:
+            facet = (None, None)
+
+        if k <= self.precompute_k:
+            cached = self.cache.get((ranking,) + facet)
+            if cached is not None:
+                return cached[:k]
+
+        if genre is not None:
+            rows = self.genre_index.rows(genre)
+        elif year is not None:
+            rows = self.year_rows(year)
+        else:
+            rows = range(len(self.store))
+        return self.select(k, ranking, rows)
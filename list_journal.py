@@ -0,0 +1,229 @@
+# DURABLE FAVOURITES AND WATCH LISTS
+import atexit
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from urllib.parse import quote
+
+JOURNAL_DIR = "user_lists"  # DIRECTORY HOLDING ONE JOURNAL PER USER
+COMMIT_INTERVAL = 0.05  # SECONDS TO GATHER WRITES INTO ONE FSYNC
+# COMPACT A JOURNAL ONCE IT IS THIS LARGE AND MOSTLY SUPERSEDED RECORDS
+COMPACT_MIN_BYTES = 16 * 1024
+COMPACT_RATIO = 2
+ADD = "+"
+REMOVE = "-"
+
+
+def record_key(fields):
+    """
+    Args:
+        fields (list): Fields of a record after the list name
+
+    Returns:
+        str or tuple: The movie's tconst, or (title, year) in records
+        saved for datasets without a tconst column
+    """
+    return fields[0] if len(fields) == 1 else tuple(fields)
+
+
+def key_fields(key):
+    return [key] if isinstance(key, str) else list(key)
+
+
+# REPLAY A JOURNAL FILE
+def replay(file):
+    """
+    Rebuilds a user's lists from their journal. A partly written last
+    record, left by a crash mid-write, is ignored.
+
+    Args:
+        file: Open text file positioned at the start of a journal
+
+    Returns:
+        tuple: Dict mapping each list name to a dict of its movie keys
+        in the order they were added, and the number of records read
+    """
+    lists = {}
+    records = 0
+    for line in file:
+        try:
+            op, name, *fields = json.loads(line)
+            key = record_key(fields)
+        except (ValueError, IndexError):
+            continue
+        records += 1
+        entries = lists.setdefault(name, {})
+        if op == ADD:
+            entries.setdefault(key)
+        elif op == REMOVE:
+            entries.pop(key, None)
+    return lists, records
+
+
+class ListJournal:
+    def __init__(self, directory=JOURNAL_DIR,
+                 commit_interval=COMMIT_INTERVAL):
+        """
+        Stores each user's favourites and watch list as an append-only
+        journal of add and remove records, one file per user.
+
+        Records are queued and written by a background thread, so
+        saving never blocks the menus. The thread waits briefly after
+        the first queued record so that records arriving together are
+        written with a single fsync, and rewrites a journal with only
+        its live entries once most of its records are superseded.
+
+        Journals are locked while written, so several processes can
+        share the directory.
+
+        Args:
+            directory (str): Directory to keep journals in
+            commit_interval (float): Seconds to gather records before
+            writing them
+        """
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.pending = queue.Queue()
+        self.writer = None
+        self.start_lock = threading.Lock()
+        # JOURNAL SIZE AT WHICH TO NEXT CHECK FOR COMPACTION, BY PATH
+        self.compact_at = {}
+
+    def path(self, user):
+        return os.path.join(self.directory,
+                            quote(user, safe="") + ".journal")
+
+    def load(self, user):
+        """
+        Reads a user's saved lists.
+
+        Args:
+            user (str): User name
+
+        Returns:
+            dict: Maps each list name to a list of movie keys in the
+            order they were added
+        """
+        try:
+            with open(self.path(user), encoding="utf-8") as file:
+                lists, _ = replay(file)
+        except FileNotFoundError:
+            return {}
+        return {name: list(entries) for name, entries in lists.items()}
+
+    def record(self, user, op, name, key):
+        """
+        Queues a change to one of a user's lists for saving.
+
+        Args:
+            user (str): User name
+            op (str): ADD or REMOVE
+            name (str): List name
+            key (str or tuple): Key of the movie from Movie.key
+        """
+        self.start()
+        self.pending.put(
+            (user, json.dumps([op, name, *key_fields(key)]) + "\n"))
+
+    def start(self):
+        # STARTED ON FIRST USE, SO IT RUNS IN THE PROCESS THAT NEEDS IT
+        # RATHER THAN ONE THAT FORKS SESSIONS
+        with self.start_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_loop,
+                                               name="list-journal",
+                                               daemon=True)
+                self.writer.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """
+        Blocks until every queued record has been written.
+        """
+        if self.writer is not None:
+            self.pending.join()
+
+    def write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.commit_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            by_user = {}
+            for user, line in batch:
+                by_user.setdefault(user, []).append(line)
+            for user, lines in by_user.items():
+                try:
+                    self.commit(user, lines)
+                except OSError:
+                    pass
+            for _ in batch:
+                self.pending.task_done()
+
+    def commit(self, user, lines):
+        """
+        Appends records to a user's journal and syncs them to disk.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(user)
+        while True:
+            with open(path, "a+", encoding="utf-8") as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                # ANOTHER PROCESS MAY HAVE REPLACED THE FILE BY COMPACTING
+                # IT WHILE WE WAITED FOR THE LOCK
+                try:
+                    if os.stat(path).st_ino != os.fstat(file.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                # END A RECORD LEFT PARTLY WRITTEN BY A CRASH, SO ONLY IT
+                # IS LOST RATHER THAN BEING JOINED TO THE NEXT ONE
+                end = os.fstat(file.fileno()).st_size
+                if end and os.pread(file.fileno(), 1, end - 1) != b"\n":
+                    file.write("\n")
+                file.writelines(lines)
+                file.flush()
+                os.fsync(file.fileno())
+                size = file.tell()
+                if size >= self.compact_at.get(path, COMPACT_MIN_BYTES):
+                    self.compact(path, file)
+                return
+
+    def compact(self, path, file):
+        """
+        Rewrites a locked journal with one add record per live entry
+        if most of its records are superseded.
+        """
+        file.seek(0)
+        lists, records = replay(file)
+        live = sum(len(entries) for entries in lists.values())
+        if records < COMPACT_RATIO * live:
+            # NOT WORTH IT YET - CHECK AGAIN ONCE IT HAS DOUBLED
+            self.compact_at[path] = 2 * file.tell()
+            return
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as temp:
+            for name, entries in lists.items():
+                for key in entries:
+                    temp.write(json.dumps([ADD, name, *key_fields(key)])
+                               + "\n")
+            temp.flush()
+            os.fsync(temp.fileno())
+        os.replace(temp_path, path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.compact_at.pop(path, None)
@@ -0,0 +1,486 @@
+# COLUMN-ORIENTED MOVIE STORAGE
+import csv
+import sys
+import textwrap
+from array import array
+from collections.abc import Sequence
+
+from columnar import map_columns
+
+ROW_WIDTH = 80  # DEFAULT WIDTH OF A PRINTED MOVIE ROW
+# WIDTH OF THE "#", YEAR, MINS, /10 AND VOTES COLUMNS PLUS TITLE PADDING
+FIXED_COLUMNS_WIDTH = 35
+MIN_TITLE_WIDTH = 20
+ROW_CACHE_WIDTHS = 4  # NUMBER OF TERMINAL WIDTHS TO KEEP CACHED ROWS FOR
+
+
+class MovieStore:
+    def __init__(self):
+        """
+        Holds the dataset in typed columns, one entry per movie row.
+        Row numbers are stable IDs for the lifetime of the store.
+
+        Attributes:
+            title_pool (str): All titles joined into one string.
+            title_offsets (array): Start offset of each title in the pool,
+            plus a final end offset.
+            years (array): Release year of each movie.
+            runtimes (array): Runtime of each movie in minutes.
+            ratings (array): Average rating of each movie in tenths
+            (e.g. 87 for 8.7).
+            votes (array): Number of votes of each movie.
+            genre_masks (array): Bitmask of genre IDs for each movie.
+            genre_names (list): Interned genre names, ordered by first
+            appearance in the dataset; list index is the genre ID.
+            genre_ids (dict): Maps each genre name to its genre ID.
+            tconsts (array): Number of each movie's IMDb ID (e.g.
+            111161 for tt0111161), or None for datasets without a
+            tconst column.
+        """
+        self.title_pool = ""
+        self.title_offsets = array("I", [0])
+        self.years = array("H")
+        self.runtimes = array("H")
+        self.ratings = array("H")
+        self.votes = array("I")
+        self.genre_masks = array("Q")
+        self.genre_names = []
+        self.genre_ids = {}
+        self.tconsts = None
+        self._pending_titles = []
+        self._row_cache = {}
+        self._key_rows = None
+
+    def __getstate__(self):
+        # FORMATTED ROWS AND THE KEY LOOKUP ARE NOT SAVED IN SNAPSHOTS
+        state = self.__dict__.copy()
+        state["_row_cache"] = {}
+        state["_key_rows"] = None
+        return state
+
+    def __len__(self):
+        return len(self.years)
+
+    def add(self, title, year, runtime, genres, rating, votes,
+            tconst=None):
+        """
+        Appends one movie to the columns. Call finish() once all
+        movies have been added.
+
+        Args:
+            title (str): The movie title.
+            year (int): The release year.
+            runtime (int): The runtime in minutes.
+            genres (list): Genre names of the movie.
+            rating (str): The average rating, e.g. "8.7".
+            votes (int): The number of votes.
+            tconst (str): The IMDb ID, e.g. "tt0111161"; kept if the
+            store has a tconsts column.
+        """
+        mask = 0
+        for genre in genres:
+            genre_id = self.genre_ids.get(genre)
+            if genre_id is None:
+                genre_id = len(self.genre_names)
+                if genre_id >= 64:
+                    raise ValueError("Too many distinct genres in dataset")
+                genre = sys.intern(genre)
+                self.genre_names.append(genre)
+                self.genre_ids[genre] = genre_id
+            mask |= 1 << genre_id
+
+        self._pending_titles.append(title)
+        self.title_offsets.append(self.title_offsets[-1] + len(title))
+        self.years.append(year)
+        self.runtimes.append(runtime)
+        self.ratings.append(round(float(rating) * 10))
+        self.votes.append(votes)
+        self.genre_masks.append(mask)
+        if self.tconsts is not None:
+            self.tconsts.append(int(tconst[2:]))
+
+    def finish(self):
+        """
+        Joins pending titles into the contiguous title pool.
+        """
+        if self._pending_titles:
+            self.title_pool += "".join(self._pending_titles)
+            self._pending_titles = []
+
+    def title(self, row):
+        return self.title_pool[self.title_offsets[row]:
+                               self.title_offsets[row + 1]]
+
+    def rating(self, row):
+        return self.ratings[row] / 10
+
+    def genres(self, row):
+        mask = self.genre_masks[row]
+        return [name for genre_id, name in enumerate(self.genre_names)
+                if mask >> genre_id & 1]
+
+    def tconst(self, row):
+        return f"tt{self.tconsts[row]:07d}"
+
+    def key(self, row):
+        """
+        Returns:
+            str or tuple: The movie's tconst, or (title, year) for
+            datasets without a tconst column, where two movies of the
+            same title and year can't be told apart.
+        """
+        if self.tconsts is None:
+            return self.title(row), self.years[row]
+        return self.tconst(row)
+
+    def find(self, key):
+        """
+        Looks a movie up by its stable key, which stays the same across
+        reloads of the dataset, unlike its row number. A (title, year)
+        key saved before the dataset had a tconst column finds the
+        first movie of that title and year.
+
+        Args:
+            key (str or tuple): Key of the movie from key()
+
+        Returns:
+            int: Row number of the movie, or None if not in the store
+        """
+        key_rows = self._key_rows
+        if key_rows is None:
+            # BUILT ASIDE AND PUBLISHED WHOLE, SO OTHER THREADS NEVER SEE
+            # A HALF-FILLED DICT; A RACE ONLY BUILDS IT TWICE
+            key_rows = {}
+            for row in range(len(self)):
+                if self.tconsts is not None:
+                    key_rows[self.tconst(row)] = row
+                key_rows.setdefault((self.title(row), self.years[row]), row)
+            self._key_rows = key_rows
+        return key_rows.get(key if isinstance(key, str) else tuple(key))
+
+    def row_text(self, row, width=ROW_WIDTH):
+        """
+        Formats every column of a printed movie row except the "#"
+        column, which changes between views. Formatted rows are cached
+        per width, so re-rendering a list joins cached strings.
+
+        Args:
+            row (int): Row number of the movie
+            width (int): Terminal width to fit the row to
+
+        Returns:
+            str: Title, year, runtime, rating and votes columns
+        """
+        cache = self._row_cache.get(width)
+        if cache is None:
+            # TERMINAL RESIZED - DROP THE OLDEST WIDTH
+            if len(self._row_cache) >= ROW_CACHE_WIDTHS:
+                del self._row_cache[next(iter(self._row_cache))]
+            cache = self._row_cache[width] = {}
+        text = cache.get(row)
+        if text is None:
+            title_width = title_column_width(width)
+            title = textwrap.shorten(self.title(row),
+                                     width=title_width - 5,
+                                     placeholder="...")
+            text = cache[row] = (
+                f'{title:<{title_width}}'
+                f'{self.years[row]:<6}'
+                f'{self.runtimes[row]:<6}'
+                f'{self.ratings[row] / 10:<6.1f}'
+                f'{self.votes[row]:>7}'
+            )
+        return text
+
+    @classmethod
+    def from_tsv(cls, path):
+        """
+        Reads a tsv dataset into a new store.
+
+        Args:
+            path (str): File path of the tsv dataset.
+
+        Returns:
+            MovieStore: Store containing every row of the dataset.
+        """
+        store = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            tsv_f = csv.DictReader(f, delimiter="\t")
+            if "tconst" in tsv_f.fieldnames:
+                store.tconsts = array("I")
+            for row in tsv_f:
+                store.add(
+                    row["primaryTitle"],
+                    int(row["startYear"]),
+                    int(row["runtimeMinutes"]),
+                    # CONVERT GENRE STRING TO LIST OF STRINGS
+                    row["genres"].split(","),
+                    row["averageRating"],
+                    int(row["numVotes"]),
+                    row.get("tconst"),
+                )
+        store.finish()
+        return store
+
+
+class MappedMovieStore(MovieStore):
+    def __init__(self, path):
+        """
+        A read-only MovieStore whose columns are memory-mapped from a
+        columnar dataset written by data_cleanup.py or columnar.py.
+
+        Opening the store takes the same time whatever the size of the
+        dataset. Values are read from the file's pages as rows are
+        used, titles are decoded when read, and the pages are shared
+        through the page cache by every process using the dataset
+        rather than copied into each one.
+
+        Args:
+            path (str): File path of the columnar dataset.
+
+        Raises:
+            OSError: File can't be opened
+            ValueError: Not a supported columnar dataset
+
+        Attributes:
+            title_bytes (memoryview): All titles as one UTF-8 string.
+            title_offsets (memoryview): Start byte of each title in
+            title_bytes, plus a final end offset.
+        """
+        super().__init__()
+        _, columns = map_columns(path)
+        self.path = path
+        self.title_pool = None
+        self.title_bytes, self.title_offsets = columns["title"]
+        self.years = columns["year"]
+        self.runtimes = columns["runtime"]
+        self.ratings = columns["rating"]
+        self.votes = columns["votes"]
+        self.tconsts = columns.get("tconst")
+        self.genre_masks, genre_names = columns["genres"]
+        self.genre_names = [sys.intern(name) for name in genre_names]
+        self.genre_ids = {name: genre_id for genre_id, name
+                          in enumerate(self.genre_names)}
+
+    def __reduce__(self):
+        # SAVED AS A REFERENCE TO THE FILE, WHICH IS MAPPED AGAIN ON LOAD
+        return MappedMovieStore, (self.path,)
+
+    def add(self, title, year, runtime, genres, rating, votes,
+            tconst=None):
+        raise TypeError("Memory-mapped stores are read-only")
+
+    def title(self, row):
+        return str(self.title_bytes[self.title_offsets[row]:
+                                    self.title_offsets[row + 1]], "utf-8")
+
+
+def title_column_width(width):
+    """
+    Returns:
+        int: Width of the title column in a row of the given width
+    """
+    return max(width - FIXED_COLUMNS_WIDTH, MIN_TITLE_WIDTH)
+
+
+# MOVIE CLASS
+class Movie:
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        """
+        Represents a movie as a read-only view of one row in a
+        MovieStore. Values are read from the store's columns on access.
+        Movies are never changed after creation, so one catalogue can be
+        shared by many sessions; list numbering belongs to the list
+        being shown, not to the movie.
+
+        Attributes:
+            store (MovieStore): The store holding the movie's data.
+            row (int): Row number of the movie in the store.
+        """
+        object.__setattr__(self, "store", store)
+        object.__setattr__(self, "row", row)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Movie records are read-only")
+
+    def __eq__(self, other):
+        return (isinstance(other, Movie)
+                and self.store is other.store and self.row == other.row)
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    def __reduce__(self):
+        return Movie, (self.store, self.row)
+
+    @property
+    def key(self):
+        """
+        Returns:
+            str or tuple: The movie's tconst, or (title, year) for
+            datasets without a tconst column, which identifies the
+            movie across reloads of the dataset.
+        """
+        return self.store.key(self.row)
+
+    @property
+    def title(self):
+        return self.store.title(self.row)
+
+    @property
+    def date(self):
+        return self.store.years[self.row]
+
+    @property
+    def runtime(self):
+        return self.store.runtimes[self.row]
+
+    @property
+    def genres(self):
+        return self.store.genres(self.row)
+
+    @property
+    def rating(self):
+        return self.store.rating(self.row)
+
+    @property
+    def votes(self):
+        return self.store.votes[self.row]
+
+    def format_row(self, index, width=ROW_WIDTH):
+        """
+        Args:
+            index (int): Number to show in the "#" column
+            width (int): Terminal width to fit the row to
+
+        Returns:
+            str: The movie as a row of a printed list.
+        """
+        return f'{index:<8}' + self.store.row_text(self.row, width)
+
+    def __str__(self):
+        """
+        Returns:
+            str: The formatted string representation of the movie.
+        """
+
+        # PRINT FORMAT FOR MOVIES
+        return self.format_row(self.row + 1)
+
+
+class MovieList(Sequence):
+    def __init__(self, store, rows):
+        """
+        Sequence of movies backed by row numbers in a MovieStore.
+        Movie views are created on access, so large lists only hold
+        their row numbers.
+
+        Args:
+            store (MovieStore): The store holding the movies' data.
+            rows (range or array): Row numbers of the movies in order.
+        """
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return MovieList(self.store, self.rows[position])
+        return Movie(self.store, self.rows[position])
+
+    def __iter__(self):
+        store = self.store
+        for row in self.rows:
+            yield Movie(store, row)
+
+    def copy(self):
+        return MovieList(self.store, self.rows)
+
+
+class CustomList(Sequence):
+    def __init__(self, movies=()):
+        """
+        A user's list of movies in the order they were added, keyed on
+        each movie's stable key so a movie appears at most once.
+        Membership checks, adds and removes by key take constant time;
+        position lookups use an ordered copy rebuilt after changes.
+
+        Args:
+            movies (iterable): Movies to start with
+        """
+        self.entries = {}
+        self._order = None
+        self.add(movies)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, movie):
+        return movie.key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __getitem__(self, position):
+        if self._order is None:
+            self._order = list(self.entries.values())
+        return self._order[position]
+
+    def add(self, movies):
+        """
+        Appends movies not already in the list.
+
+        Returns:
+            list: The movies added, in order
+        """
+        added = []
+        for movie in movies:
+            if movie.key not in self.entries:
+                self.entries[movie.key] = movie
+                added.append(movie)
+        if added:
+            self._order = None
+        return added
+
+    def remove(self, movies):
+        """
+        Removes movies from the list, ignoring any not in it.
+
+        Returns:
+            list: The movies removed, in order
+        """
+        removed = [self.entries.pop(movie.key) for movie in movies
+                   if movie.key in self.entries]
+        if removed:
+            self._order = None
+        return removed
+
+    def remap(self, find_movie):
+        """
+        Replaces each movie with the movie of the same key from another
+        catalogue, keeping the list's order, and drops movies the
+        catalogue no longer has. Movies are keyed on their key in the
+        other catalogue, which differs once a dataset gains a tconst
+        column.
+
+        Args:
+            find_movie (function): Maps a key to a Movie, or None
+
+        Returns:
+            list: The movies dropped
+        """
+        entries = {}
+        dropped = []
+        for key, movie in self.entries.items():
+            new_movie = find_movie(key)
+            if new_movie is None:
+                dropped.append(movie)
+            else:
+                entries[new_movie.key] = new_movie
+        self.entries = entries
+        self._order = None
+        return dropped
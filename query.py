@@ -0,0 +1,177 @@
+# COMPOUND MOVIE QUERIES
+from search_index import normalise_title
+
+# SORT ORDERS ACCEPTED BY MovieQuery, IN ADDITION TO THE LEADERBOARD RANKINGS
+SORT_COLUMNS = {
+    "year": "years",
+    "runtime": "runtimes",
+}
+
+
+class MovieQuery:
+    def __init__(self, text="", all_genres=(), any_genres=(), no_genres=(),
+                 year=(None, None), runtime=(None, None),
+                 rating=(None, None), votes=(None, None),
+                 sort=None, descending=True):
+        """
+        Describes a combined search over titles, genres and numeric
+        ranges. Every given criterion must match.
+
+        Attributes:
+            text (str): Text the title must contain
+            all_genres (list): Genres a movie must have every one of
+            any_genres (list): Genres a movie must have at least one of
+            no_genres (list): Genres a movie must not have
+            year (tuple): Inclusive (low, high) release years; either
+            bound may be None
+            runtime (tuple): Inclusive (low, high) runtime in minutes
+            rating (tuple): Inclusive (low, high) rating in tenths
+            votes (tuple): Inclusive (low, high) number of votes
+            sort (str): "votes", "rating", "weighted", "year", "runtime"
+            or None to keep dataset order
+            descending (bool): Sort highest first
+        """
+        self.text = text
+        self.all_genres = list(all_genres)
+        self.any_genres = list(any_genres)
+        self.no_genres = list(no_genres)
+        self.ranges = {
+            "year": year,
+            "runtime": runtime,
+            "rating": rating,
+            "votes": votes,
+        }
+        self.sort = sort
+        self.descending = descending
+
+
+class QueryEngine:
+    def __init__(self, store, title_index, genre_index, numeric_indexes,
+                 leaderboards):
+        """
+        Runs MovieQuery objects against the catalogue's indexes.
+
+        The engine estimates how many candidates each criterion's index
+        would return, fetches candidates from the most selective one and
+        checks the remaining criteria against the store's columns.
+        """
+        self.store = store
+        self.title_index = title_index
+        self.genre_index = genre_index
+        self.numeric_indexes = numeric_indexes
+        self.leaderboards = leaderboards
+
+    def plan(self, query):
+        """
+        Lists the ways of fetching candidates for a query, cheapest
+        first.
+
+        Args:
+            query (MovieQuery): Query to plan
+
+        Returns:
+            list: (estimated rows, criterion name, fetch function) tuples
+        """
+        steps = []
+        if query.text:
+            steps.append((self.title_index.estimate(query.text), "title",
+                          lambda: self.title_index.search(query.text)))
+
+        genres = self.genre_index
+        if query.all_genres:
+            steps.append((
+                min(len(genres.rows(genre)) for genre in query.all_genres),
+                "genres",
+                lambda: genres.select(all_of=query.all_genres),
+            ))
+        elif query.any_genres:
+            steps.append((
+                sum(len(genres.rows(genre)) for genre in query.any_genres),
+                "genres",
+                lambda: genres.select(any_of=query.any_genres),
+            ))
+
+        for name, (low, high) in query.ranges.items():
+            if low is None and high is None:
+                continue
+            index = self.numeric_indexes[name]
+            steps.append((index.count(low, high), name,
+                          lambda index=index, low=low, high=high:
+                          index.between(low, high)))
+
+        steps.append((len(self.store), "all",
+                      lambda: range(len(self.store))))
+        steps.sort(key=lambda step: step[0])
+        return steps
+
+    def row_filter(self, query, skip):
+        """
+        Builds a check of every criterion except the one the candidates
+        were fetched with.
+
+        Args:
+            query (MovieQuery): Query to check rows against
+            skip (str): Name of the criterion already satisfied
+
+        Returns:
+            function: Takes a row number, returns True if it matches.
+        """
+        store = self.store
+        title = self.title_index.title
+        text = normalise_title(query.text) if skip != "title" else ""
+        genre_masks = store.genre_masks
+        all_mask = self.genre_index.mask(query.all_genres)
+        any_mask = self.genre_index.mask(query.any_genres)
+        no_mask = self.genre_index.mask(query.no_genres)
+        columns = {
+            "year": store.years,
+            "runtime": store.runtimes,
+            "rating": store.ratings,
+            "votes": store.votes,
+        }
+        bounds = [(columns[name], low, high)
+                  for name, (low, high) in query.ranges.items()
+                  if name != skip and (low is not None or high is not None)]
+
+        def matches(row):
+            mask = genre_masks[row]
+            if mask & all_mask != all_mask:
+                return False
+            if any_mask and not mask & any_mask:
+                return False
+            if mask & no_mask:
+                return False
+            for column, low, high in bounds:
+                value = column[row]
+                if low is not None and value < low:
+                    return False
+                if high is not None and value > high:
+                    return False
+            return not text or text in title(row)
+
+        return matches
+
+    def run(self, query):
+        """
+        Finds all movies matching a query.
+
+        Args:
+            query (MovieQuery): Query to run
+
+        Returns:
+            list: Row numbers of matching movies in the query's sort
+            order, or dataset order if it has none.
+
+        Raises:
+            KeyError: Unknown genre or sort order
+        """
+        _, driver, fetch = self.plan(query)[0]
+        rows = sorted(filter(self.row_filter(query, driver), fetch()))
+
+        if query.sort in SORT_COLUMNS:
+            key = getattr(self.store, SORT_COLUMNS[query.sort]).__getitem__
+        elif query.sort is not None:
+            key = self.leaderboards.key(query.sort)
+        else:
+            return rows
+        return sorted(rows, key=key, reverse=query.descending)
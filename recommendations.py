@@ -0,0 +1,195 @@
+# "MORE LIKE THIS" RECOMMENDATIONS
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+
+# NUMBER OF MOVIES RECOMMENDED
+RECOMMENDATIONS = 20
+# SHARE OF THE SIMILARITY FROM GENRES; THE REST IS FROM YEAR, RUNTIME,
+# RATING AND VOTES
+GENRE_WEIGHT = 0.6
+NUMERIC_WEIGHT = 1 - GENRE_WEIGHT
+NUMERIC_FEATURES = 4
+
+
+def genre_ids(mask):
+    """
+    Returns:
+        tuple: Genre IDs set in a genre bitmask.
+    """
+    ids = []
+    genre_id = 0
+    while mask:
+        if mask & 1:
+            ids.append(genre_id)
+        mask >>= 1
+        genre_id += 1
+    return tuple(ids)
+
+
+def normalise(values, transform=float):
+    """
+    Scales a column to the range 0-1.
+
+    Returns:
+        array: Scaled value of each row.
+    """
+    values = [transform(value) for value in values]
+    low = min(values, default=0)
+    span = max(values, default=0) - low or 1
+    return array("d", ((value - low) / span for value in values))
+
+
+class Recommender:
+    def __init__(self, store):
+        """
+        Finds movies similar to one movie or to a list of movies.
+
+        Each movie is described by a feature vector: the genres it has
+        (multi-hot), and its year, runtime, rating and log of votes,
+        each scaled to 0-1. Two movies' similarity is
+
+            GENRE_WEIGHT * genre Jaccard similarity
+            + NUMERIC_WEIGHT * (1 - mean distance of the other features)
+
+        so it is 1 for identical movies. Movies are grouped by their
+        genre combination and sorted by year within each group, so a
+        search can skip whole groups whose genres are too different, and
+        stop reading a group once its years are too far away, while
+        still returning the exact top matches.
+
+        Args:
+            store (MovieStore): Store holding the movies' data
+
+        Attributes:
+            years (array): Scaled release year of each movie
+            runtimes (array): Scaled runtime of each movie
+            ratings (array): Scaled rating of each movie
+            votes (array): Scaled log of the votes of each movie
+            groups (dict): Maps each genre bitmask in the dataset to its
+            genre IDs, and its movies' row numbers and scaled years
+            sorted by year
+        """
+        self.store = store
+        self.years = normalise(store.years)
+        self.runtimes = normalise(store.runtimes)
+        self.ratings = normalise(store.ratings)
+        self.votes = normalise(store.votes,
+                               lambda votes: math.log10(votes + 1))
+
+        groups = {}
+        for row, mask in enumerate(store.genre_masks):
+            groups.setdefault(mask, []).append(row)
+        self.groups = {}
+        for mask, rows in groups.items():
+            rows.sort(key=self.years.__getitem__)
+            self.groups[mask] = (genre_ids(mask), array("I", rows),
+                                 array("d", (self.years[row]
+                                             for row in rows)))
+
+    def features(self, row):
+        """
+        Returns:
+            tuple: Scaled year, runtime, rating and votes of a movie.
+        """
+        return (self.years[row], self.runtimes[row], self.ratings[row],
+                self.votes[row])
+
+    def profile(self, rows):
+        """
+        Averages the feature vectors of some movies.
+
+        Args:
+            rows (list): Row numbers of the movies
+
+        Returns:
+            tuple: Dict mapping each genre ID to the share of the movies
+            with that genre, and the mean of each other feature
+        """
+        genres = {}
+        numeric = [0.0] * NUMERIC_FEATURES
+        for row in rows:
+            for genre_id in genre_ids(self.store.genre_masks[row]):
+                genres[genre_id] = genres.get(genre_id, 0) + 1
+            for index, value in enumerate(self.features(row)):
+                numeric[index] += value
+        return ({genre_id: count / len(rows)
+                 for genre_id, count in genres.items()},
+                [value / len(rows) for value in numeric])
+
+    def similar(self, rows, k=RECOMMENDATIONS):
+        """
+        Finds the movies most similar to a movie, or to the average of
+        a list of movies such as a user's favourites.
+
+        Args:
+            rows (list): Row numbers of the movies to match
+            k (int): Most movies to return
+
+        Returns:
+            list: Row numbers of up to k other movies, most similar
+            first.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        genre_weights, numeric = self.profile(rows)
+        total_weight = sum(genre_weights.values())
+
+        # WEIGHTED JACCARD SIMILARITY OF EACH GENRE COMBINATION
+        ranked = []
+        for mask, (ids, _, _) in self.groups.items():
+            shared = sum(genre_weights.get(genre_id, 0) for genre_id in ids)
+            union = len(ids) + total_weight - shared
+            ranked.append((shared / union if union else 1.0, mask))
+        ranked.sort(reverse=True)
+
+        # MIN-HEAP OF THE BEST k (SCORE, -ROW) FOUND SO FAR
+        best = []
+        exclude = set(rows)
+        for genre_similarity, mask in ranked:
+            genre_score = GENRE_WEIGHT * genre_similarity
+            if len(best) == k and genre_score + NUMERIC_WEIGHT < best[0][0]:
+                break
+            self.search_group(mask, genre_score, numeric, exclude, k, best)
+        return [-row for _, row in sorted(best, reverse=True)]
+
+    def search_group(self, mask, genre_score, numeric, exclude, k, best):
+        """
+        Adds the movies of one genre combination that are among the k
+        most similar to best, reading them outwards from the closest
+        year until none further away could be.
+        """
+        _, rows, years = self.groups[mask]
+        year = numeric[0]
+        right = bisect_left(years, year)
+        left = right - 1
+        while left >= 0 or right < len(rows):
+            # TAKE WHICHEVER SIDE IS CLOSER IN YEAR
+            if right >= len(rows) or (
+                    left >= 0 and year - years[left] <= years[right] - year):
+                position = left
+                left -= 1
+            else:
+                position = right
+                right += 1
+
+            # THE OTHER FEATURES CAN AT BEST MATCH EXACTLY
+            year_distance = abs(years[position] - year)
+            if len(best) == k and (
+                    genre_score + NUMERIC_WEIGHT
+                    * (1 - year_distance / NUMERIC_FEATURES) < best[0][0]):
+                break
+
+            row = rows[position]
+            if row in exclude:
+                continue
+            distance = sum(abs(value - target) for value, target
+                           in zip(self.features(row), numeric))
+            entry = (genre_score + NUMERIC_WEIGHT
+                     * (1 - distance / NUMERIC_FEATURES), -row)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
@@ -1,6 +1,16 @@
-# IMPORT CSV MODULE
-import csv
-import textwrap
+import math
+import os
+import signal
+import threading
+from array import array
+
+from catalogue import LOAD_STAGES, Catalogue
+from leaderboards import RANKINGS
+from list_journal import ListJournal
+from movie_store import ROW_WIDTH, MovieList, title_column_width
+from query import MovieQuery
+from recommendations import RECOMMENDATIONS
+from session import Session
 
 # COLOUR ESCAPE SEQ
 GREEN = "\033[92m"
@@ -11,172 +21,272 @@ BG_GREEN = "\033[42m"
 RESET = "\033[0m"
 
 DATASET = "movie_data.tsv"  # FILE PATH FOR IMDB DATASET
-all_movies = []  # LIST FOR ALL MOVIES
-top_100 = []  # LIST FOR TOP 100 MOVIES
+COLUMNS_DATASET = "movie_data.columns"  # TYPED BINARY COPY OF DATASET
+PAGE_RESERVED_ROWS = 12  # TERMINAL ROWS KEPT FOR HEADERS AND MENUS
+MIN_PAGE_SIZE = 5  # FEWEST MOVIES SHOWN PER PAGE
+FUZZY_RESULTS = 20  # CLOSEST TITLES SHOWN WHEN A SEARCH HAS NO MATCHES
+AUTOCOMPLETE_RESULTS = 10  # TITLES SHOWN WHILE SEARCHING AS YOU TYPE
+RELOAD_CHECK_INTERVAL = 5  # SECONDS BETWEEN CHECKS FOR A NEW DATASET
+catalogue = None  # CATALOGUE NEW SCREENS USE; REPLACED WHOLE ON RELOAD
+movies = None  # MOVIES COLLECTION FOR THE CURRENT CATALOGUE
+list_journal = ListJournal()  # SAVES FAVOURITES AND WATCH LISTS
+reload_requested = threading.Event()  # SET TO RELOAD THE DATASET AT ONCE
+watcher_pid = None  # PROCESS THE DATASET WATCHER THREAD RUNS IN
+
 
 # LIST HEADER FORMATTING
-list_headers = (BG_GREEN
-                + (
-                    f'{"#":<8}'
-                    f'{"Title":<45}'
-                    f'{"Year":<6}'
-                    f'{"Mins":<6}'
-                    f'{"/10":<6}'
-                    f'{"Votes":>7}'
-                )
-                + RESET)
+def list_header(width=ROW_WIDTH):
+    """
+    Returns:
+        str: Column headers for a movie list fitted to the given width
+    """
+    return (BG_GREEN
+            + (
+                f'{"#":<8}'
+                f'{"Title":<{title_column_width(width)}}'
+                f'{"Year":<6}'
+                f'{"Mins":<6}'
+                f'{"/10":<6}'
+                f'{"Votes":>7}'
+            )
+            + RESET)
+
+
+list_headers = list_header()
 
 
 class Movies:
-    def __init__(self, top_100, all_movies):
+    def __init__(self, catalogue):
         """
-        Represents collection of all movies.
+        Represents collection of all movies. Shared read-only by
+        every session; per-user lists live on Session.
 
         Args:
-            top_100 (list): Top 100 movies list
-            all_movies (list): List of all 1000 movies
+            catalogue (Catalogue): Catalogue the movies come from
         """
-        self.top_100 = top_100
-        self.all_movies = all_movies
-        self.favourites = []
-        self.watchlist = []
+        self.catalogue = catalogue
+
+    @property
+    def top_100(self):
+        return self.catalogue.top_100
+
+    @property
+    def all_movies(self):
+        return self.catalogue.all_movies
 
-    def print_movies(self, movies_list):
+    def print_movies(self, session, movies_list, page=1):
         """
-        Prints movies in list format.
+        Prints one page of movies in list format. Only the rows on the
+        page are formatted, and the page is written to the terminal
+        in a single write. Rows are numbered by their position in this
+        list, so the movies themselves are never changed.
 
         Args:
+            session (Session): Session to print to
             movies_list (list): List of movies passed to function for printing
+            page (int): Page number to print, starting from 1
         """
-        movies = movies_list.copy()
-        print(list_headers)
-        for index, movie in enumerate(movies_list, start=1):
-            movie.index = index
-            print(BG_BLUE + f"{movie}" + RESET)
-        print(list_headers)
+        size = page_size(session)
+        width = max(session.terminal_size()[0], ROW_WIDTH)
+        pages = page_count(session, movies_list)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * size
+        header = list_header(width)
+        lines = [header]
+        for index, movie in enumerate(movies_list[start:start + size],
+                                      start=start + 1):
+            lines.append(BG_BLUE + movie.format_row(index, width) + RESET)
+        lines.append(header)
+        if pages > 1:
+            lines.append(f"Page {page} of {pages} "
+                         f"({len(movies_list)} movies)")
+        session.write("\n".join(lines) + "\n")
+
+
+# NUMBER OF MOVIES SHOWN PER PAGE
+def page_size(session):
+    """
+    Fits a page of movies, the list headers and a menu into the
+    session's terminal.
 
+    Returns:
+        int: Number of movies per page
+    """
+    rows = session.terminal_size()[1]
+    return max(rows - PAGE_RESERVED_ROWS, MIN_PAGE_SIZE)
 
-# MOVIE CLASS
-class Movie:
-    def __init__(self, index, title, date, runtime, genres, rating, votes):
-        """
-        Represents a movie.
-
-        Attributes:
-            index (int): The index to show in the printed list.
-            title (str): The movie title.
-            date (str): The release year of the movie.
-            runtime (str): The duration of the movie in minutes.
-            genres (list): The genres of the movie.
-            rating (str): The average rating of the movie.
-            votes (str): The number of votes received by the movie.
-        """
 
-        self.index = index  # INDEX TO SHOW IN PRINTED LIST
-        self.title = title  # MOVIE TITLE
-        self.date = date  # RELEASE DATE
-        self.runtime = runtime  # MOVIE RUNTIME
-        self.genres = genres  # GENRES
-        self.rating = rating  # RATING
-        self.votes = votes  # NUM VOTES
+# NUMBER OF PAGES IN A LIST OF MOVIES
+def page_count(session, movies_list):
+    """
+    Returns:
+        int: Number of pages needed to show the list; at least 1
+    """
+    return max(math.ceil(len(movies_list) / page_size(session)), 1)
 
-    def __str__(self):
-        """
-        Returns:
-            str: The formatted string representation of the movie.
-        """
 
-        # PRINT FORMAT FOR MOVIES
-        return (
-            f'{self.index:<8}'
-            f'{textwrap.shorten(self.title, width=40, placeholder="..."):<45}'
-            f'{self.date:<6}'
-            f'{self.runtime:<6}'
-            f'{self.rating:<6}'
-            f'{self.votes:>7}'
-        )
+# CHECK FOR PAGE NAVIGATION KEYS
+def turn_page(answer, page, pages):
+    """
+    Works out the page to show after the user enters a menu answer.
+
+    Args:
+        answer (str): User input
+        page (int): Current page number
+        pages (int): Number of pages in the list
+
+    Returns:
+        int: New page number, or None if the answer isn't N or P
+    """
+    if pages <= 1:
+        return None
+    if answer.strip().lower() == "n":
+        return min(page + 1, pages)
+    if answer.strip().lower() == "p":
+        return max(page - 1, 1)
+    return None
+
+
+# PAGE NAVIGATION MENU OPTIONS
+def page_options(pages):
+    """
+    Returns:
+        str: Menu lines for next/previous page, if the list has
+        more than one page
+    """
+    if pages <= 1:
+        return ""
+    return "N - Next page\nP - Previous page\n"
 
 
-def intro_screen():
+def intro_screen(session):
     """
     Graphic to print on initial load of app only.
     """
-    print(RED)
-    print(' ██████╗██╗███╗   ██╗███████╗███╗   ███╗ █████╗ ████████╗███████╗')
-    print('██╔════╝██║████╗  ██║██╔════╝████╗ ████║██╔══██╗╚══██╔══╝██╔════╝')
-    print('██║     ██║██╔██╗ ██║█████╗  ██╔████╔██║███████║   ██║   █████╗  ')
-    print('██║     ██║██║╚██╗██║██╔══╝  ██║╚██╔╝██║██╔══██║   ██║   ██╔══╝  ')
-    print('╚██████╗██║██║ ╚████║███████╗██║ ╚═╝ ██║██║  ██║   ██║   ███████╗')
-    print(' ╚═════╝╚═╝╚═╝  ╚═══╝╚══════╝╚═╝     ╚═╝╚═╝  ╚═╝   ╚═╝   ╚══════╝')
-    print('\n')
-    print('Search for your next favourite flick with CineMate!')
-    print(RESET)
+    session.write(
+        RED + "\n"
+        + ' ██████╗██╗███╗   ██╗███████╗███╗   ███╗ █████╗ ████████╗███████╗\n'
+        + '██╔════╝██║████╗  ██║██╔════╝████╗ ████║██╔══██╗╚══██╔══╝██╔════╝\n'
+        + '██║     ██║██╔██╗ ██║█████╗  ██╔████╔██║███████║   ██║   █████╗  \n'
+        + '██║     ██║██║╚██╗██║██╔══╝  ██║╚██╔╝██║██╔══██║   ██║   ██╔══╝  \n'
+        + '╚██████╗██║██║ ╚████║███████╗██║ ╚═╝ ██║██║  ██║   ██║   ███████╗\n'
+        + ' ╚═════╝╚═╝╚═╝  ╚═══╝╚══════╝╚═╝     ╚═╝╚═╝  ╚═╝   ╚═╝   ╚══════╝\n'
+        + "\n\n\n"
+        + "Search for your next favourite flick with CineMate!\n"
+        + RESET + "\n"
+    )
 
 
 # CLEAR TERMINAL SCREEN
-def clear_screen():
+def clear_screen(session):
     """
     Call to clear screen after user action.
     """
 
-    print("\033c")
+    session.print("\033c")
 
 
-# GETS DATA FROM IMDB DATASET AND STORES IN LIST
-def get_movies():
+# NEXT SCREEN TO SHOW
+def goto(screen, **kwargs):
     """
-    Reads tsv dataset and creates a Movie object for each instance.
+    Screens return this instead of calling the next screen, so
+    navigation never grows the call stack.
+
+    Args:
+        screen (function): Screen function to run next
+        kwargs: Arguments to call it with
 
     Returns:
-        list: List of all movies in dataset.
+        tuple: Screen function and its arguments
+    """
+    return screen, kwargs
+
+
+# RUN SCREENS UNTIL THE SESSION ENDS
+def run_menus(session, screen=None, **kwargs):
     """
+    Runs one screen at a time, each returning the next screen to show.
+    Only the current screen's data is kept alive, so memory stays flat
+    over long sessions.
+
+    Args:
+        session (Session): Session the screens belong to
+        screen (function): First screen to show; defaults to home_menu
+        kwargs: Arguments for the first screen
+    """
+    next_screen = goto(screen or home_menu, **kwargs)
+    while next_screen is not None:
+        screen, kwargs = next_screen
+        use_current_catalogue(session)
+        next_screen = screen(session, **kwargs)
+
 
-    with open(DATASET, "r", encoding="utf-8") as f:
-        tsv_f = csv.DictReader(f, delimiter="\t")
-        global all_movies
-        for index, row in enumerate(tsv_f, start=1):
-            title = row["primaryTitle"]
-            date = row["startYear"]
-            runtime = row["runtimeMinutes"]
-            # CONVERT GENRE STRING TO LIST OF STRINGS
-            genres = row["genres"].split(",")
-            rating = row["averageRating"]
-            votes = row["numVotes"]
-            movie = Movie(index, title, date, runtime, genres, rating, votes)
-            all_movies.append(movie)
-        return all_movies
+# MOVE A SESSION ONTO A RELOADED CATALOGUE
+def use_current_catalogue(session):
+    """
+    Switches the session to the current catalogue between screens, so
+    a screen never sees movies from two versions of the dataset. The
+    session's lists are remapped to the new catalogue's movies.
+    """
+    if reload_requested.is_set() and watcher_pid != os.getpid():
+        # NO WATCHER IN THIS PROCESS, E.G. A SESSION FORKED BY
+        # session_server.py: LOAD THE SNAPSHOT ITS PARENT HAS SAVED
+        reload_requested.clear()
+        reload_catalogue(snapshot_only=True)
+    current = catalogue
+    if session.catalogue is not current:
+        if session.catalogue is not None:
+            session.remap_lists(current)
+        session.catalogue = current
+
+
+# ASK WHICH USER'S LISTS TO USE
+def ask_user_name(session):
+    """
+    Asks for a user name the first time the user's lists are needed,
+    so favourites and watch list can be saved between sessions.
+    Entering nothing keeps the lists for this session only.
+    """
+    if session.user is None:
+        session.user = session.input(
+            YELLOW
+            + "\nEnter your user name to save your lists between visits,"
+            + "\nor press enter to skip: "
+            + RESET
+        ).strip()
 
 
 # SHOWS MOVIE LIST
-def show_movies():
+def show_movies(session):
     """
-    Prints all 1000 movies from get_movies to terminal.
+    Prints first page of all movies from get_movies to terminal.
     """
+    catalogue = wait_for(session, "movies")
 
-    clear_screen()
-    movies.print_movies(all_movies)
-    select_user_action()
+    clear_screen(session)
+    movies.print_movies(session, catalogue.all_movies)
+    return goto(select_user_action)
 
 
 # HOME MENU FOR USER SELECTION
-def home_menu(initial_load=False):
+def home_menu(session, initial_load=False):
     """
     Prints home menu to terminal.
     """
     # SHOW INTRO SCREEN IF FIRST LOAD
     if initial_load is False:
-        clear_screen()
-    print(GREEN + "\nPlease select an option from the menu below:")
-    print("1 - Show all movies")
-    print("2 - Show favourites")
-    print("3 - Show watch list")
-    print("4 - Show top 100 (by most votes)")
-    print("5 - Browse movies" + RESET)
-    get_selection()
+        clear_screen(session)
+    session.print(GREEN + "\nPlease select an option from the menu below:")
+    session.print("1 - Show all movies")
+    session.print("2 - Show favourites")
+    session.print("3 - Show watch list")
+    session.print("4 - Show top 100 (by most votes)")
+    session.print("5 - Browse movies" + RESET)
+    return get_selection(session)
 
 
 # REGISTER USERS MENU SELECTION
-def get_selection():
+def get_selection(session):
     """
     Prompt user to choose option from home_menu and take
     appropriate action.
@@ -185,38 +295,48 @@ def get_selection():
     while True:
         try:
             selection = int(
-                input(YELLOW
-                      + "\nPlease enter a number from the menu: "
-                      + RESET)
+                session.input(YELLOW
+                              + "\nPlease enter a number from the menu: "
+                              + RESET)
             )
         except ValueError:
-            print(RED
-                  + "\nInvalid choice; please choose a valid option"
-                  + RESET)
+            session.print(RED
+                          + "\nInvalid choice; please choose a valid option"
+                          + RESET)
         else:
             if selection == 1:
-                show_movies()
+                return goto(show_movies)
             elif selection == 2:
-                show_custom_list(custom_list=movies.favourites,
-                                 list_name_string="favourites")
+                ask_user_name(session)
+                wait_for(session, "movies")
+                return goto(show_custom_list,
+                            custom_list=session.favourites,
+                            list_name_string="favourites")
             elif selection == 3:
-                show_custom_list(custom_list=movies.watchlist,
-                                 list_name_string="watch list")
+                ask_user_name(session)
+                wait_for(session, "movies")
+                return goto(show_custom_list,
+                            custom_list=session.watchlist,
+                            list_name_string="watch list")
             elif selection == 4:
-                show_top_100()
+                return goto(show_top_100)
             elif selection == 5:
-                browse_movies()
+                return goto(browse_movies)
             else:
-                print(RED
-                      + "\nInvalid choice; please choose a valid option"
-                      + RESET)
+                session.print(
+                    RED
+                    + "\nInvalid choice; please choose a valid option"
+                    + RESET
+                )
                 continue
 
 
 # PROMPT USER ACTION ON MOVIES LIST
-def select_user_action(genre_results=None,
+def select_user_action(session,
+                       genre_results=None,
                        top_100=None,
-                       search_results=None):
+                       search_results=None,
+                       page=1):
     """
     Prompt user to select an option from menu and take appropriate action.
 
@@ -227,143 +347,233 @@ def select_user_action(genre_results=None,
         Top 100 movies
         search_results: Passed if user is currently viewing
         search results
+        page: Page of the list currently shown
     """
+    movies_list = (top_100 or genre_results or search_results
+                   or session.catalogue.all_movies)
+    pages = page_count(session, movies_list)
     action = None
-    while action not in range(0, 3):
+    while action not in range(0, 4):
         try:
-            action = int(
-                input(
-                    GREEN
-                    + '\nSelect from the following:\n'
-                    '1 - Add a favourite\n'
-                    '2 - Add to watch list\n'
-                    '0 - Exit to menu\n'
-                    + RESET
-                )
+            answer = session.input(
+                GREEN
+                + '\nSelect from the following:\n'
+                '1 - Add a favourite\n'
+                '2 - Add to watch list\n'
+                '3 - More like this\n'
+                + page_options(pages)
+                + '0 - Exit to menu\n'
+                + RESET
             )
-            if action not in range(0, 3):
+
+            # SHOW NEXT/PREVIOUS PAGE
+            new_page = turn_page(answer, page, pages)
+            if new_page is not None:
+                page = new_page
+                clear_screen(session)
+                movies.print_movies(session, movies_list, page)
+                continue
+
+            action = int(answer)
+            if action not in range(0, 4):
                 raise ValueError
 
         except ValueError:
-            print(RED
-                  + "\nInvalid choice; please choose a valid option"
-                  + RESET)
+            session.print(RED
+                          + "\nInvalid choice; please choose a valid option"
+                          + RESET)
 
         else:
             # IF EXIT CHOSEN
             if action == 0:
-                home_menu()
+                return goto(home_menu)
 
             # IF FAVOURITE CHOSEN
             elif action == 1:
-                add_to_custom_list(
-                    genre_results,
-                    top_100,
-                    search_results,
-                    custom_list=movies.favourites,
+                ask_user_name(session)
+                return goto(
+                    add_to_custom_list,
+                    genre_results=genre_results,
+                    top_100=top_100,
+                    search_results=search_results,
+                    custom_list=session.favourites,
                     list_name_string="favourites",
                 )
 
             # IF WATCH LIST CHOSEN
             elif action == 2:
-                add_to_custom_list(
-                    genre_results,
-                    top_100,
-                    search_results,
-                    custom_list=movies.watchlist,
+                ask_user_name(session)
+                return goto(
+                    add_to_custom_list,
+                    genre_results=genre_results,
+                    top_100=top_100,
+                    search_results=search_results,
+                    custom_list=session.watchlist,
                     list_name_string="watch list",
                 )
 
+            # IF MORE LIKE THIS CHOSEN
+            elif action == 3:
+                movie = movies_list[prompt_number(
+                    session, "\nEnter ID of the movie from the list: ",
+                    1, len(movies_list)) - 1]
+                return goto(show_recommendations, like=[movie],
+                            like_name=movie.title)
+
 
 # SHOW WATCH/FAV LIST
-def show_custom_list(removed=None,
+def show_custom_list(session,
+                     removed=None,
                      custom_list=None,
-                     list_name_string=None):
+                     list_name_string=None,
+                     page=1):
     """
     Shows specified custom list to user - either
     favourites or watch list, depending on context
 
     Args:
-        removed: Used to store Movie removed
+        removed: Used to store Movies removed
         from custom list, if applicable
         custom_list: Specifies which list to use -
         favourites or watch list
         list_name_string: Used for printing list name
         in context to terminal ('favourites' or 'watch list')
+        page: Page of the list to show
     """
 
-    clear_screen()
+    clear_screen(session)
 
     # IF LIST EMPTY, SHOW MESSAGE
     if len(custom_list) == 0 or len(custom_list) is None:
-        print(list_headers)
-        print(RED + f"{list_name_string} empty" + RESET)
-        print(list_headers)
-        print(GREEN + "\nPlease select an option from the menu below:")
-        print("0 - Exit to main menu" + RESET)
+        session.print(list_headers)
+        session.print(RED + f"{list_name_string} empty" + RESET)
+        session.print(list_headers)
+        session.print(GREEN + "\nPlease select an option from the menu below:")
+        session.print("0 - Exit to main menu" + RESET)
         while True:
             try:
                 selection = int(
-                    input(YELLOW
-                          + "\nPlease enter a number from the menu: "
-                          + RESET)
+                    session.input(YELLOW
+                                  + "\nPlease enter a number from the menu: "
+                                  + RESET)
                 )
             except ValueError:
-                print(RED
-                      + "\nInvalid choice; please choose a valid option"
-                      + RESET)
+                session.print(
+                    RED
+                    + "\nInvalid choice; please choose a valid option"
+                    + RESET
+                )
             else:
                 if selection == 0:
-                    home_menu()
+                    return goto(home_menu)
                 else:
-                    print(RED
-                          + "\nInvalid choice; please choose a valid option"
-                          + RESET)
+                    session.print(
+                        RED
+                        + "\nInvalid choice; please choose a valid option"
+                        + RESET
+                    )
                     continue
 
         # ELSE PRINT LIST OF MOVIES
     else:
-        movies.print_movies(custom_list)
+        movies.print_movies(session, custom_list, page)
+        pages = page_count(session, custom_list)
 
         # PRINTS REMOVED MOVIE IF APPLICABLE
         if removed:
-            print(RED
-                  + f"\n{removed.title} removed from {list_name_string}"
-                  + RESET)
+            session.print(
+                RED
+                + f"\n{describe_movies(removed)} removed from "
+                f"{list_name_string}"
+                + RESET
+            )
 
         # SHOW OPTIONS MENU
-        print(GREEN + "\nPlease select an option from the menu below:")
-        print(f"1 - Remove from {list_name_string}")
-        print("0 - Exit to main menu" + RESET)
+        session.print(GREEN + "\nPlease select an option from the menu below:")
+        session.print(f"1 - Remove from {list_name_string}")
+        session.print("2 - Recommend movies like these")
+        session.print(page_options(pages) + "0 - Exit to main menu" + RESET)
 
         while True:
             try:
-                selection = int(
-                    input(YELLOW
-                          + "\nPlease enter a number from the menu: "
-                          + RESET)
+                answer = session.input(
+                    YELLOW
+                    + "\nPlease enter a number from the menu: "
+                    + RESET
                 )
+
+                # SHOW NEXT/PREVIOUS PAGE
+                new_page = turn_page(answer, page, pages)
+                if new_page is not None:
+                    return goto(show_custom_list,
+                                custom_list=custom_list,
+                                list_name_string=list_name_string,
+                                page=new_page)
+
+                selection = int(answer)
             except ValueError:
-                print(RED
-                      + "\nInvalid choice; please choose a valid option"
-                      + RESET)
+                session.print(
+                    RED
+                    + "\nInvalid choice; please choose a valid option"
+                    + RESET
+                )
             else:
                 if selection == 1:
-                    remove_from_custom_list(
+                    return goto(
+                        remove_from_custom_list,
                         custom_list=custom_list,
                         list_name_string=list_name_string
                     )
+                elif selection == 2:
+                    return goto(show_recommendations,
+                                like=list(custom_list),
+                                like_name=f"your {list_name_string}")
                 elif selection == 0:
-                    home_menu()
+                    return goto(home_menu)
                 else:
-                    print(RED
-                          + "\nInvalid choice; please choose a valid option"
-                          + RESET)
+                    session.print(
+                        RED
+                        + "\nInvalid choice; please choose a valid option"
+                        + RESET
+                    )
                     continue
 
 
-# FOR USER TO ADD A MOVIE TO LIST
+# RECOMMEND MOVIES LIKE OTHERS
+def show_recommendations(session, like=None, like_name=None):
+    """
+    Shows the movies most similar to a movie, or to all the movies in
+    one of the user's lists, by genres, year, runtime, rating and votes.
+
+    Args:
+        like (list): Movies to recommend similar movies to
+        like_name (str): Description of those movies for the heading
+    """
+    catalogue = wait_for(session, "similar")
+
+    # LOOK THE MOVIES UP BY KEY IN CASE THE CATALOGUE WAS RELOADED
+    rows = [row for row in (catalogue.store.find(movie.key)
+                            for movie in like)
+            if row is not None]
+    search_results = MovieList(
+        catalogue.store,
+        catalogue.recommender.similar(rows, RECOMMENDATIONS))
+
+    clear_screen(session)
+    if len(search_results) == 0:
+        session.print(RED + "No recommendations found" + RESET)
+        # KEEP THE MESSAGE ON SCREEN UNTIL THE USER HAS READ IT
+        session.input(YELLOW + "\nPress enter to return to the menu: "
+                      + RESET)
+        return goto(home_menu)
+    session.print(GREEN + f"\nMovies like {like_name}:" + RESET)
+    movies.print_movies(session, search_results)
+    return goto(select_user_action, search_results=search_results)
+
+
+# FOR USER TO ADD MOVIES TO LIST
 def add_to_custom_list(
+    session,
     genre_results=None,
     top_100=None,
     search_results=None,
@@ -387,12 +597,12 @@ def add_to_custom_list(
         in context to terminal ('favourites' or 'watch list')
 
     Raises:
-        TypeError: Movie already in custom list
-        ValueError, IndexError: Incorrect value entered
+        TypeError: Movies already in custom list
+        ValueError: Incorrect value entered
         or value not in list of movies
 
     Returns:
-        custom_list: List of movies in the custom list
+        tuple: Next screen to show
     """
 
     # CHECK WHERE USER IS COMING FROM TO GET CORRECT MOVIE LIST
@@ -403,54 +613,55 @@ def add_to_custom_list(
     elif search_results:
         movies = search_results
     else:
-        global all_movies
-        movies = all_movies
+        movies = session.catalogue.all_movies
 
-    add_movie = None
-    while add_movie is None:
+    added = None
+    while not added:
         try:
-            # ENTER # OF MOVIE
-            add_movie = (
-                int(
-                    input(
+            # ENTER #S OF MOVIES, E.G. 3,7,12-20
+            chosen = [
+                movies[number - 1]
+                for number in parse_id_list(
+                    session.input(
                         YELLOW
-                        + (f'\nType the ID of the movie and press '
-                            f'enter to add to '
-                            f'{list_name_string}: ')
+                        + (f'\nType the IDs of the movies (e.g. 3,7,12-20) '
+                           f'and press enter to add to '
+                           f'{list_name_string}: ')
                         + RESET
-                    )
+                    ),
+                    len(movies),
                 )
-                - 1
-            )
+            ]
 
-            # CHECK IF MOVIE ALREADY IN LIST
-            if movies[add_movie].title not in [movie.title
-                                               for movie
-                                               in custom_list]:
-                # ADD CHOICE TO LIST
-                custom_list.append(movies[add_movie])
-                print(
-                    GREEN
-                    + f'\n{movies[add_movie].title} added to '
+            # ADD CHOICES NOT ALREADY IN LIST
+            added = session.add_to_list(custom_list, chosen)
+            if not added:
+                raise TypeError
+            session.print(
+                GREEN
+                + f'\n{describe_movies(added)} added to '
+                f'{list_name_string}'
+                + RESET
+            )
+            if len(added) < len(chosen):
+                session.print(
+                    RED
+                    + f'{len(chosen) - len(added)} already in '
                     f'{list_name_string}'
                     + RESET
                 )
 
-            else:
-                raise TypeError
-
         # ERROR FOR INVALID CHOICE
-        except (ValueError, IndexError):
-            print(RED
-                  + "\nInvalid choice; please choose a valid option"
-                  + RESET)
-            add_movie = None
+        except ValueError:
+            session.print(RED
+                          + "\nInvalid choice; please choose a valid option"
+                          + RESET)
 
         # ERROR IF ALREADY IN LIST
         except TypeError:
-            print(
+            session.print(
                 RED
-                + f'\n{movies[add_movie].title} already in '
+                + f'\n{describe_movies(chosen)} already in '
                 f'{list_name_string}'
                 + RESET
             )
@@ -459,7 +670,7 @@ def add_to_custom_list(
     while user_continue not in ["y", "n", "Y", "N"]:
 
         # PROMPT USER FOR Y/N TO CONTINUE
-        user_continue = input(
+        user_continue = session.input(
             YELLOW
             + f'\nDo you want to add another movie to '
             f' {list_name_string}? (Y/N) '
@@ -468,29 +679,44 @@ def add_to_custom_list(
 
         # IF YES - ASK AGAIN
         if user_continue.lower() == "y":
-            add_to_custom_list(
-                movies,
+            return goto(
+                add_to_custom_list,
+                genre_results=movies,
                 custom_list=custom_list,
                 list_name_string=list_name_string
             )
 
         # IF NO - QUIT
         elif user_continue.lower() == "n":
-            home_menu()
+            return goto(home_menu)
 
         # IF INVALID CHOICE - KEEP ASKING
         else:
-            print(RED
-                  + "\nInvalid choice; please choose a valid option (Y/N)"
-                  + RESET)
+            session.print(
+                RED
+                + "\nInvalid choice; please choose a valid option (Y/N)"
+                + RESET
+            )
+
 
-    return custom_list
+# DESCRIBE MOVIES IN FEEDBACK MESSAGES
+def describe_movies(movies_list):
+    """
+    Returns:
+        str: The movie's title if there is one movie, otherwise the
+        number of movies
+    """
+    if len(movies_list) == 1:
+        return movies_list[0].title
+    return f"{len(movies_list)} movies"
 
 
 # REMOVE FROM WATCH/FAV LIST
-def remove_from_custom_list(custom_list=None, list_name_string=None):
+def remove_from_custom_list(session,
+                            custom_list=None,
+                            list_name_string=None):
     """
-    Removes user-selected movie from custom list.
+    Removes user-selected movies from custom list.
 
     Args:
         custom_list: Specifies which list to use -
@@ -499,116 +725,101 @@ def remove_from_custom_list(custom_list=None, list_name_string=None):
         in context to terminal ('favourites' or 'watch list')
     """
 
-    selection = None
-    while selection is None:
+    while True:
         try:
-            selection = (
-                int(
-                    input(
-                        YELLOW
-                        + (f'\nType the ID of the movie and press '
-                            f'enter to remove from '
-                           f'{list_name_string}: ')
-                        + RESET
-                    )
-                )
-                - 1
+            # ENTER #S OF MOVIES, E.G. 3,7,12-20
+            selection = parse_id_list(
+                session.input(
+                    YELLOW
+                    + (f'\nType the IDs of the movies (e.g. 3,7,12-20) '
+                       f'and press enter to remove from '
+                       f'{list_name_string}: ')
+                    + RESET
+                ),
+                len(custom_list),
             )
 
-            # REMOVE SELECTED MOVIE FROM LIST
-            removed = custom_list.pop(selection)
-        except (ValueError, IndexError):
-            print(RED
-                  + "\nInvalid choice; please choose a valid option"
-                  + RESET)
-            selection = None
+            # REMOVE SELECTED MOVIES FROM LIST
+            removed = session.remove_from_list(
+                custom_list, [number - 1 for number in selection])
+        except ValueError:
+            session.print(RED
+                          + "\nInvalid choice; please choose a valid option"
+                          + RESET)
 
         else:
             # SHOW FEEDBACK MSG
-            print(GREEN
-                  + f"\n{removed.title} removed from {list_name_string}\n"
-                  + RESET)
+            session.print(
+                GREEN
+                + f"\n{describe_movies(removed)} removed from "
+                f"{list_name_string}\n"
+                + RESET
+            )
 
             # SHOW UPDATED LIST
-            show_custom_list(
-                removed,
+            return goto(
+                show_custom_list,
+                removed=removed,
                 custom_list=custom_list,
                 list_name_string=list_name_string
             )
 
 
-# CREATE TOP 100 MOVIES LIST
-def create_top_100():
-    """
-    Runs on initialisation.
-    Creates list of Top 100 movies based on number of votes.
-
-    Returns:
-        top_100: List of Top 100 rated movies
-    """
-    global top_100
-    global all_movies
-    movies = all_movies.copy()  # GET ALL MOVIES
-
-    # SORT BY NUM VOTES
-    sorted_by_votes = sorted(movies,
-                             key=lambda movie: int(movie.votes),
-                             reverse=True)
-
-    # GET ONLY TOP 100 WITH MOST VOTES
-    top_100 = sorted_by_votes[:100]
-
-    # SORT MOST VOTED MOVIES BY RATING
-    top_100 = sorted(top_100,
-                     key=lambda movie: float(movie.rating),
-                     reverse=True)
-
-
 # SHOWS TOP 100 LIST OF MOVIES
-def show_top_100():
+def show_top_100(session):
     """
     Prints list of Top 100 to terminal.
     """
+    catalogue = wait_for(session, "top")
 
-    clear_screen()
-    movies.print_movies(top_100)
-    select_user_action(top_100)
+    clear_screen(session)
+    movies.print_movies(session, catalogue.top_100)
+    return goto(select_user_action, top_100=catalogue.top_100)
 
 
 # BROWSE ALL MOVIES
-def browse_movies():
+def browse_movies(session):
     """
     Shows menu of options to user to choose browsing method
     """
 
-    clear_screen()
+    clear_screen(session)
     action = None
-    while action not in ["0", "1", "2", "3"]:
-        print(
+    while action not in ["0", "1", "2", "3", "4", "5", "6"]:
+        session.print(
             GREEN
             + "\nSelect from the following:\n"
             "1 - Search movies\n"
             "2 - Browse by genre\n"
             "3 - Browse by year\n"
+            "4 - Top movies by genre or year\n"
+            "5 - Advanced search\n"
+            "6 - Search as you type\n"
             "0 - Exit to menu"
             + RESET
             + "\n"
         )
-        action = input(
+        action = session.input(
             YELLOW
             + "Please enter a number from the menu: "
             + RESET
         )
         if action == "1":
-            browse_movies_search()
+            return goto(browse_movies_search)
         elif action == "2":
-            browse_movies_genre()
+            return goto(browse_movies_genre)
         elif action == "3":
-            browse_movies_year()
+            return goto(browse_movies_year)
+        elif action == "4":
+            return goto(browse_movies_top)
+        elif action == "5":
+            return goto(browse_movies_advanced)
+        elif action == "6":
+            return goto(browse_movies_autocomplete)
         elif action == "0":
-            home_menu()
+            return goto(home_menu)
         else:
-            print(
+            session.print(
                 RED
                 + "\nInvalid choice; please choose a valid option"
                 + RESET
@@ -616,34 +827,41 @@ def browse_movies():
 
 
 # SEARCH MOVIES BY TITLE
-def browse_movies_search():
+def browse_movies_search(session):
     """
     Shows list of movies with title containing a user's
-    search query
+    search query. If no title contains it, shows the closest titles
+    instead, so a misspelt query still finds the movie.
     """
+    catalogue = wait_for(session, "search")
 
-    clear_screen()
-    query = input(
+    clear_screen(session)
+    query = session.input(
         YELLOW
         + "Enter a search query: "
         + RESET
     )
-    search_results = []
-    for movie in movies.all_movies:
-        if query.lower() in movie.title.lower():
-            search_results.append(movie)
-        else:
-            pass
+    search_results = MovieList(catalogue.store,
+                               catalogue.title_index.search(query))
     if len(search_results) == 0:
-        print(RED + "No matches found" + RESET)
+        search_results = MovieList(
+            catalogue.store,
+            catalogue.title_index.fuzzy_search(query, catalogue.store.votes,
+                                               FUZZY_RESULTS))
+        if len(search_results) > 0:
+            session.print(YELLOW + "No exact matches; closest titles:"
+                          + RESET)
+
+    if len(search_results) == 0:
+        session.print(RED + "No matches found" + RESET)
 
     else:
-        movies.print_movies(search_results)
+        movies.print_movies(session, search_results)
 
     user_continue = None
     while user_continue not in ["y", "n", "Y", "N"]:
         # PROMPT USER FOR Y/N TO CONTINUE
-        user_continue = input(
+        user_continue = session.input(
             YELLOW
             + "\nDo you want to enter another search query? (Y/N) "
             + RESET
@@ -651,44 +869,83 @@ def browse_movies_search():
 
         # IF YES - ASK AGAIN
         if user_continue.lower() == "y":
-            browse_movies_search()
+            return goto(browse_movies_search)
 
         # IF NO - SHOW OPTIONS
         elif user_continue.lower() == "n":
             if len(search_results) > 0:
-                select_user_action(search_results)
+                return goto(select_user_action, search_results=search_results)
             else:
-                home_menu()
+                return goto(home_menu)
 
         # IF INVALID CHOICE - KEEP ASKING
         else:
-            print(
+            session.print(
                 RED
                 + "\nInvalid choice; please choose a valid option (Y/N)"
                 + RESET
             )
 
 
+# SEARCH MOVIES BY TITLE AS THE USER TYPES
+def browse_movies_autocomplete(session):
+    """
+    Shows the most voted movies with a title word starting with what
+    the user has typed so far, refining the list with each entry.
+    Each refinement is looked up in the prefix index rather than by
+    scanning all movies.
+    """
+    catalogue = wait_for(session, "search")
+
+    prefix = ""
+    while True:
+        clear_screen(session)
+        search_results = MovieList(
+            catalogue.store,
+            catalogue.prefix_index.complete(prefix, AUTOCOMPLETE_RESULTS))
+        if len(search_results) == 0:
+            session.print(RED + "No matches found" + RESET)
+        else:
+            movies.print_movies(session, search_results)
+
+        session.print(GREEN
+                      + "\nType more of the title to narrow the results\n"
+                      "< - Delete the last letter\n"
+                      "Press enter when done"
+                      + RESET)
+        answer = session.input(YELLOW + f"\nSearch: {prefix}" + RESET)
+
+        if answer == "<":
+            prefix = prefix[:-1]
+        elif answer:
+            prefix += answer
+        elif len(search_results) > 0:
+            return goto(select_user_action, search_results=search_results)
+        else:
+            return goto(browse_movies)
+
+
 # BROWSE MOVIES BY GENRE
-def browse_movies_genre():
+def browse_movies_genre(session):
     """
     Prints a list of genres for user to select from.
     """
+    catalogue = wait_for(session, "genres")
 
-    clear_screen()
-    genres = get_genres()  # GET LIST OF GENRES
-    print(GREEN + "\nSelect from the following: " + RESET)
+    clear_screen(session)
+    genres = get_genres(catalogue)  # GET LIST OF GENRES
+    session.print(GREEN + "\nSelect from the following: " + RESET)
 
     # PRINT LIST OF GENRES TO CHOOSE
     for index, genre in enumerate(genres, start=1):
-        print(BG_BLUE + f"{index:<2} - {genre:<15}" + RESET)
+        session.print(BG_BLUE + f"{index:<2} - {genre:<15}" + RESET)
 
     genre_index = None
     while genre_index is None:
         try:
             # GET USER GENRE CHOICE
             genre_index = (
-                int(input(
+                int(session.input(
                     YELLOW
                     + "\nEnter ID number of genre from the list: "
                     + RESET)) - 1
@@ -696,21 +953,21 @@ def browse_movies_genre():
             genre_choice = genres[genre_index]
 
         except (IndexError, ValueError):
-            print(
+            session.print(
                 RED
                 + "\nInvalid choice; please choose a valid option"
                 + RESET)
             genre_index = None
 
         else:
-            clear_screen()
-            genre_results = create_genre_results(movies, genre_choice)
+            clear_screen(session)
+            genre_results = create_genre_results(session, genre_choice)
 
     user_continue = None
     while user_continue not in ["y", "n", "Y", "N"]:
 
         # PROMPT USER FOR Y/N TO CONTINUE
-        user_continue = input(
+        user_continue = session.input(
             YELLOW
             + "\nDo you want to choose a different genre? (Y/N) "
             + RESET
@@ -718,15 +975,15 @@ def browse_movies_genre():
 
         # IF YES - ASK AGAIN
         if user_continue.lower() == "y":
-            browse_movies_genre()
+            return goto(browse_movies_genre)
 
         # IF NO - SHOW OPTIONS
         elif user_continue.lower() == "n":
-            select_user_action(genre_results)
+            return goto(select_user_action, genre_results=genre_results)
 
         # IF INVALID CHOICE - KEEP ASKING
         else:
-            print(
+            session.print(
                 RED
                 + "\nInvalid choice; please choose a valid option (Y/N)"
                 + RESET
@@ -734,90 +991,77 @@ def browse_movies_genre():
 
 
 # CREATE GENRE SEARCH RESULTS MOVIE LIST
-def create_genre_results(movies, genre_choice):
+def create_genre_results(session, genre_choice):
     """
     Creates list of movies containing user-selected genre.
 
     Returns:
         list: List of movies to print to screen.
     """
-    search_results = []
-
-    # ITERATE THROUGH ALL MOVIES
-    for movie in movies.all_movies:
-
-        # IF USERS GENRE MATCHES MOVIE, PRINT MOVIE
-        if genre_choice in movie.genres:
-            search_results.append(movie)
-            movie.index = len(search_results)
-    movies.print_movies(search_results)
+    catalogue = session.catalogue
+    search_results = MovieList(catalogue.store,
+                               catalogue.genre_index.rows(genre_choice))
+    movies.print_movies(session, search_results)
     return search_results
 
 
 # TO DEFINE LIST OF GENRES
-def get_genres():
+def get_genres(catalogue):
     """
-    Iterates through all movies in IMDB list and creates a list of
-    unique genres to print on screen for user to select from.
+    Returns the list of unique genres in the dataset, in order of
+    first appearance, for user to select from. Built once on load.
+
+    Args:
+        catalogue (Catalogue): Catalogue to list the genres of
 
     Returns:
         list: List of unique genres in entire dataset
     """
 
-    genres_array = []  # ARRAY TO STORE GENRES
-
-    # ITERATE THROUGH ALL MOVIES, ADD GENRES TO ARRAY
-    for movie in movies.all_movies:
-        for genre in movie.genres:
-
-            # IF GENRE ALREADY IN ARRAY, SKIP
-            if genre in genres_array:
-                continue
-
-            # ADD TO GENRES ARAY
-            genres_array.append(genre)
-    return genres_array
+    return catalogue.genre_index.names
 
 
-def browse_movies_year():
+def browse_movies_year(session):
     """
-    Shows list of movies based on user-selected release year.
+    Shows list of movies based on user-selected release year
+    or range of years (e.g. 2005-2012).
 
     Raises:
         ValueError: Year entered outside of accepted range.
     """
-    search_results = []
-    query = None
-    while query is None:
+    catalogue = wait_for(session, "ranges")
+
+    years = catalogue.numeric_indexes["year"]
+    first_year = years.min()
+    last_year = years.max()
+    year_range = None
+    while year_range is None:
         try:
-            query = input(YELLOW
-                          + "\nEnter a year from 2000 - 2023: "
-                          + RESET)
-            if 2000 > int(query) or int(query) > 2023:
-                query = None
-                raise ValueError
+            query = session.input(YELLOW
+                                  + f"\nEnter a year or range of years from "
+                                  f"{first_year} - {last_year}: "
+                                  + RESET)
+            year_range = parse_year_range(query, first_year, last_year)
 
         except ValueError:
-            print(
+            session.print(
                 RED
-                + "\nInvalid choice; please enter a year from 2000 - 2023"
+                + f"\nInvalid choice; please enter a year from "
+                f"{first_year} - {last_year}"
                 + RESET
             )
-            query = None
+            year_range = None
 
-    for movie in movies.all_movies:
-        if query in movie.date:
-            search_results.append(movie)
-            movie.index = len(search_results)
-        else:
-            pass
+    # KEEP DATASET ORDER (MOST VOTES FIRST)
+    rows = sorted(years.between(*year_range))
+    search_results = MovieList(catalogue.store, array("I", rows))
 
-    movies.print_movies(search_results)
+    movies.print_movies(session, search_results)
 
     # PROMPT USER FOR Y/N TO CONTINUE
     user_continue = None
     while user_continue not in ["y", "n", "Y", "N"]:
-        user_continue = input(
+        user_continue = session.input(
             YELLOW
             + "\nDo you want to choose a different year? (Y/N) "
             + RESET
@@ -825,21 +1069,517 @@ def browse_movies_year():
 
         # IF YES - ASK AGAIN
         if user_continue.lower() == "y":
-            browse_movies_year()
+            return goto(browse_movies_year)
+
+        # IF NO - SHOW OPTIONS
+        elif user_continue.lower() == "n":
+            return goto(select_user_action, search_results=search_results)
+
+        # IF INVALID CHOICE - KEEP ASKING
+        else:
+            session.print(
+                RED
+                + "\nInvalid choice; please choose a valid option (Y/N)"
+                + RESET
+            )
+
+
+# PROMPT USER FOR A NUMBER WITHIN A RANGE
+def prompt_number(session, message, low, high):
+    """
+    Keeps asking until the user enters a whole number within an
+    inclusive range.
+
+    Args:
+        message (str): Prompt to show
+        low (int): Lowest number accepted
+        high (int): Highest number accepted
+
+    Returns:
+        int: Number entered
+    """
+    while True:
+        try:
+            number = int(session.input(YELLOW + message + RESET))
+            if number < low or number > high:
+                raise ValueError
+        except ValueError:
+            session.print(RED
+                          + f"\nInvalid choice; please enter a number "
+                          f"from {low} - {high}"
+                          + RESET)
+        else:
+            return number
+
+
+# BROWSE TOP MOVIES BY RANKING, GENRE OR YEAR
+def browse_movies_top(session):
+    """
+    Shows a leaderboard of top movies for a user-selected ranking,
+    optionally within a genre or year.
+    """
+    catalogue = wait_for(session, "top")
+
+    clear_screen(session)
+    rankings = list(RANKINGS)
+    session.print(GREEN
+                  + "\nRank movies by:\n"
+                  + "\n".join(
+                      f"{index} - {RANKINGS[ranking]}"
+                      for index, ranking in enumerate(rankings, start=1))
+                  + RESET)
+    ranking = rankings[
+        prompt_number(session, "\nPlease enter a number from the menu: ",
+                      1, len(rankings)) - 1
+    ]
+
+    session.print(GREEN
+                  + "\nShow top movies from:\n"
+                  "1 - All movies\n"
+                  "2 - A genre\n"
+                  "3 - A year"
+                  + RESET)
+    scope = prompt_number(session,
+                          "\nPlease enter a number from the menu: ", 1, 3)
+
+    genre = None
+    year = None
+    if scope == 2:
+        genres = get_genres(catalogue)
+        for index, genre_name in enumerate(genres, start=1):
+            session.print(BG_BLUE + f"{index:<2} - {genre_name:<15}" + RESET)
+        genre = genres[
+            prompt_number(session,
+                          "\nEnter ID number of genre from the list: ",
+                          1, len(genres)) - 1
+        ]
+    elif scope == 3:
+        years = catalogue.numeric_indexes["year"]
+        year = prompt_number(
+            session,
+            f"\nEnter a year from {years.min()} - {years.max()}: ",
+            years.min(),
+            years.max())
+
+    k = prompt_number(session,
+                      "\nHow many movies do you want to see? (1-100) ",
+                      1, 100)
+
+    clear_screen(session)
+    top_results = MovieList(catalogue.store,
+                            catalogue.leaderboards.top(k, ranking,
+                                                       genre=genre,
+                                                       year=year))
+    movies.print_movies(session, top_results)
+
+    user_continue = None
+    while user_continue not in ["y", "n", "Y", "N"]:
+
+        # PROMPT USER FOR Y/N TO CONTINUE
+        user_continue = session.input(
+            YELLOW
+            + "\nDo you want to see a different leaderboard? (Y/N) "
+            + RESET
+        )
+
+        # IF YES - ASK AGAIN
+        if user_continue.lower() == "y":
+            return goto(browse_movies_top)
 
         # IF NO - SHOW OPTIONS
         elif user_continue.lower() == "n":
-            select_user_action(search_results)
+            if len(top_results) > 0:
+                return goto(select_user_action, top_100=top_results)
+            else:
+                return goto(home_menu)
 
         # IF INVALID CHOICE - KEEP ASKING
         else:
-            print(RED
-                  + "\nInvalid choice; please choose a valid option (Y/N)"
+            session.print(
+                RED
+                + "\nInvalid choice; please choose a valid option (Y/N)"
+                + RESET
+            )
+
+
+# PROMPT USER FOR AN OPTIONAL VALUE
+def prompt_optional(session, message, parse):
+    """
+    Keeps asking until the user leaves the answer blank or enters
+    a value that can be parsed.
+
+    Args:
+        message (str): Prompt to show
+        parse (function): Converts the answer, raising ValueError
+        if it is invalid
+
+    Returns:
+        Parsed value, or None if left blank
+    """
+    while True:
+        answer = session.input(YELLOW + message + RESET).strip()
+        if not answer:
+            return None
+        try:
+            return parse(answer)
+        except ValueError:
+            session.print(RED
+                          + "\nInvalid choice; please try again or leave blank"
+                          + RESET)
+
+
+# READ LIST OF IDS FROM USER INPUT
+def parse_id_list(text, high):
+    """
+    Parses a list of IDs and ranges of IDs, e.g. "3,7,12-20".
+
+    Args:
+        text (str): User input
+        high (int): Highest ID accepted
+
+    Raises:
+        ValueError: Input is not a list of IDs from 1 to high
+
+    Returns:
+        list: IDs in the order entered, without duplicates
+    """
+    ids = {}
+    for part in text.split(","):
+        bounds = part.strip().split("-")
+        if len(bounds) == 1:
+            low = last = int(bounds[0])
+        elif len(bounds) == 2:
+            low, last = int(bounds[0]), int(bounds[1])
+        else:
+            raise ValueError
+        if low < 1 or last > high or low > last:
+            raise ValueError
+        for number in range(low, last + 1):
+            ids[number] = None
+    return list(ids)
+
+
+# SEARCH MOVIES BY TITLE, GENRES, YEARS, RATING AND RUNTIME TOGETHER
+def browse_movies_advanced(session):
+    """
+    Asks the user for any combination of search criteria and shows
+    movies matching all of them. Each criterion can be left blank.
+    """
+    catalogue = wait_for(session, "query")
+
+    clear_screen(session)
+    genres = get_genres(catalogue)
+    first_year = catalogue.numeric_indexes["year"].min()
+    last_year = catalogue.numeric_indexes["year"].max()
+
+    session.print(GREEN + "\nLeave any question blank to skip it." + RESET)
+    text = session.input(YELLOW + "\nTitle contains: " + RESET).strip()
+
+    session.print(GREEN + "\nGenres:" + RESET)
+    for index, genre in enumerate(genres, start=1):
+        session.print(BG_BLUE + f"{index:<2} - {genre:<15}" + RESET)
+    all_genres = prompt_optional(
+        session,
+        "\nEnter IDs of genres the movie must have (e.g. 1,5): ",
+        lambda answer: parse_id_list(answer, len(genres))) or []
+    no_genres = prompt_optional(
+        session,
+        "\nEnter IDs of genres to leave out (e.g. 17): ",
+        lambda answer: parse_id_list(answer, len(genres))) or []
+
+    year = prompt_optional(
+        session,
+        f"\nEnter a year or range of years from "
+        f"{first_year} - {last_year}: ",
+        lambda answer: parse_year_range(answer, first_year, last_year)
+    ) or (None, None)
+    min_rating = prompt_optional(
+        session,
+        "\nEnter a minimum rating out of 10 (e.g. 8.0): ",
+        parse_rating)
+    max_runtime = prompt_optional(
+        session,
+        "\nEnter a maximum runtime in minutes (e.g. 120): ", int)
+    min_votes = prompt_optional(
+        session,
+        "\nEnter a minimum number of votes (e.g. 500000): ", int)
+
+    sort_orders = list(RANKINGS) + ["year"]
+    session.print(GREEN
+                  + "\nSort by:\n"
+                  + "\n".join(
+                      f"{index} - {RANKINGS.get(order, 'Newest')}"
+                      for index, order in enumerate(sort_orders, start=1))
                   + RESET)
+    sort_order = sort_orders[
+        prompt_number(session, "\nPlease enter a number from the menu: ",
+                      1, len(sort_orders)) - 1
+    ]
+
+    query = MovieQuery(
+        text=text,
+        all_genres=[genres[index - 1] for index in all_genres],
+        no_genres=[genres[index - 1] for index in no_genres],
+        year=year,
+        rating=(min_rating, None),
+        runtime=(None, max_runtime),
+        votes=(min_votes, None),
+        sort=sort_order,
+    )
+    search_results = MovieList(catalogue.store,
+                               array("I", catalogue.query_engine.run(query)))
+
+    clear_screen(session)
+    if len(search_results) == 0:
+        session.print(RED + "No matches found" + RESET)
+    else:
+        movies.print_movies(session, search_results)
 
+    user_continue = None
+    while user_continue not in ["y", "n", "Y", "N"]:
 
-intro_screen()
-get_movies()
-create_top_100()
-movies = Movies(top_100, all_movies)
-home_menu(initial_load=True)
+        # PROMPT USER FOR Y/N TO CONTINUE
+        user_continue = session.input(
+            YELLOW
+            + "\nDo you want to do another advanced search? (Y/N) "
+            + RESET
+        )
+
+        # IF YES - ASK AGAIN
+        if user_continue.lower() == "y":
+            return goto(browse_movies_advanced)
+
+        # IF NO - SHOW OPTIONS
+        elif user_continue.lower() == "n":
+            if len(search_results) > 0:
+                return goto(select_user_action, search_results=search_results)
+            else:
+                return goto(home_menu)
+
+        # IF INVALID CHOICE - KEEP ASKING
+        else:
+            session.print(
+                RED
+                + "\nInvalid choice; please choose a valid option (Y/N)"
+                + RESET
+            )
+
+
+# READ YEAR OR RANGE OF YEARS FROM USER INPUT
+def parse_year_range(query, first_year, last_year):
+    """
+    Parses a single year ("2010") or an inclusive range of years
+    ("2005-2012") entered by the user.
+
+    Args:
+        query (str): User input
+        first_year (int): Earliest year accepted
+        last_year (int): Latest year accepted
+
+    Raises:
+        ValueError: Input is not a year or range of years within
+        the accepted years.
+
+    Returns:
+        tuple: First and last year of the range
+    """
+    parts = query.replace("–", "-").split("-")
+    if len(parts) == 1:
+        low = high = int(parts[0])
+    elif len(parts) == 2:
+        low, high = int(parts[0]), int(parts[1])
+    else:
+        raise ValueError
+    if low > high:
+        low, high = high, low
+    if low < first_year or high > last_year:
+        raise ValueError
+    return low, high
+
+
+# READ RATING FROM USER INPUT
+def parse_rating(answer):
+    """
+    Parses a rating out of 10 entered by the user.
+
+    Raises:
+        ValueError: Input is not a number from 0 to 10
+
+    Returns:
+        int: Rating in tenths (e.g. 87 for 8.7)
+    """
+    rating = float(answer)
+    if not 0 <= rating <= 10:
+        # ALSO REJECTS inf AND nan
+        raise ValueError
+    return round(rating * 10)
+
+
+# LOAD DATASET AND BUILD MOVIES COLLECTION
+def load_catalogue():
+    """
+    Reads the dataset and builds the Top 100 list and the Movies
+    collection used by the menus. Called once per process, or once
+    in the parent when sessions are forked by session_server.py.
+
+    Loads the saved snapshot when it matches the dataset, otherwise
+    reads the dataset and saves a new snapshot.
+
+    Returns:
+        Movies: Collection of all movies.
+    """
+    new_catalogue = Catalogue(DATASET, COLUMNS_DATASET)
+    publish(new_catalogue)
+    new_catalogue.load()
+    return movies
+
+
+# MAKE A CATALOGUE THE ONE NEW SCREENS USE
+def publish(new_catalogue):
+    """
+    Replaces the current catalogue. Assigning the global is atomic, so
+    each screen sees either the old catalogue or the new one whole.
+    """
+    global catalogue
+    global movies
+    catalogue = new_catalogue
+    movies = Movies(new_catalogue)
+
+
+# LOAD CATALOGUE WITHOUT HOLDING UP THE MENUS
+def start_loading():
+    """
+    Loads the catalogue on a background thread so the intro screen
+    and home menu can be shown straight away. Screens call wait_for()
+    for the parts of the catalogue they use.
+
+    Returns:
+        threading.Thread: The loading thread
+    """
+    new_catalogue = Catalogue(DATASET, COLUMNS_DATASET)
+    publish(new_catalogue)
+    thread = threading.Thread(target=load_in_background,
+                              args=(new_catalogue,),
+                              name="catalogue-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_in_background(new_catalogue):
+    try:
+        new_catalogue.load()
+    except BaseException:
+        # KEPT ON THE CATALOGUE AND RAISED BY SCREENS WAITING FOR IT
+        pass
+
+
+# WAIT FOR PARTS OF THE CATALOGUE
+def wait_for(session, *stages):
+    """
+    Blocks until the given parts of the session's catalogue have
+    loaded, telling the user if they have to wait.
+
+    Args:
+        session (Session): Session to show the message to
+        stages (str): Names from LOAD_STAGES
+
+    Raises:
+        Exception: Loading the catalogue failed
+
+    Returns:
+        Catalogue: The session's catalogue
+    """
+    if not session.catalogue.is_loaded(*stages):
+        session.print(YELLOW + "\nLoading movies, please wait..." + RESET)
+    session.catalogue.wait(*stages)
+    return session.catalogue
+
+
+# RELOAD THE DATASET IF IT HAS CHANGED
+def reload_catalogue(force=False, snapshot_only=False):
+    """
+    Builds a new catalogue from the dataset, off to the side of the
+    one in use, and publishes it once it is fully loaded. Sessions
+    move onto it at their next screen; screens already running finish
+    with the old one.
+
+    Args:
+        force (bool): Reload even if the dataset looks unchanged
+        snapshot_only (bool): Only load the catalogue from a snapshot
+        saved by another process, keeping the old one if there is none
+
+    Returns:
+        bool: Whether a new catalogue was published
+    """
+    current = catalogue
+    if not current.is_loaded(*LOAD_STAGES):
+        return False
+    if (not force
+            and current.source_signature() == current.signature):
+        return False
+    new_catalogue = Catalogue(DATASET, COLUMNS_DATASET)
+    try:
+        new_catalogue.load(snapshot_only)
+    except Exception:
+        # KEEP SERVING THE OLD DATASET, E.G. IF THE NEW ONE IS HALF
+        # WRITTEN; IT IS TRIED AGAIN WHEN IT NEXT CHANGES
+        current.signature = current.source_signature()
+        return False
+    publish(new_catalogue)
+    return True
+
+
+# WATCH THE DATASET FOR CHANGES
+def start_watching(interval=RELOAD_CHECK_INTERVAL):
+    """
+    Starts a background thread in this process that reloads the
+    catalogue when the dataset files are replaced, checking every
+    interval seconds, or at once on SIGUSR1 (e.g.
+    kill -USR1 PID after running data_cleanup.py). Not for processes
+    that fork sessions, as a fork would copy the thread's state
+    mid-reload; session_server.py checks for reloads itself.
+
+    Args:
+        interval (float): Seconds between checks of the dataset
+    """
+    global watcher_pid
+    if watcher_pid == os.getpid():
+        return
+    watcher_pid = os.getpid()
+    threading.Thread(target=watch_dataset, args=(interval,),
+                     name="catalogue-watcher", daemon=True).start()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: reload_requested.set())
+
+
+def watch_dataset(interval):
+    while True:
+        force = reload_requested.wait(interval)
+        reload_requested.clear()
+        reload_catalogue(force)
+
+
+# START A USER SESSION
+def run_session(session=None):
+    """
+    Shows intro screen and home menu for a single user session.
+    Expects load_catalogue() to have been called already.
+
+    Args:
+        session (Session): Session to run; defaults to a new session
+        on the process's terminal
+    """
+    session = session or Session()
+    if session.journal is None:
+        session.journal = list_journal
+    intro_screen(session)
+    run_menus(session, home_menu, initial_load=True)
+
+
+if __name__ == "__main__":
+    main_session = Session(journal=list_journal)
+    intro_screen(main_session)
+    start_loading()
+    start_watching()
+    run_menus(main_session, home_menu, initial_load=True)
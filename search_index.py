@@ -0,0 +1,466 @@
+# SEARCH INDEXES
+import heapq
+import math
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+NGRAM_SIZE = 3
+# SEPARATES TITLES IN THE POOL SO MATCHES CAN'T SPAN TWO TITLES
+TITLE_SEPARATOR = "\x00"
+# STOP INTERSECTING ONCE THIS FEW CANDIDATES ARE LEFT TO VERIFY
+VERIFY_LIMIT = 64
+# SHARE OF A QUERY'S TRIGRAMS A TITLE MUST HAVE TO BE A CLOSE MATCH
+MIN_SIMILARITY = 0.3
+# MOST POSTING LIST ENTRIES READ PER FUZZY SEARCH, WHICH BOUNDS ITS TIME
+# HOWEVER LARGE THE CATALOGUE; THE MOST COMMON TRIGRAMS ARE SKIPPED FIRST
+FUZZY_POSTINGS_BUDGET = 250_000
+# MOST COMPLETIONS KEPT FOR A PREFIX
+PREFIX_TOP_N = 20
+# PREFIXES MATCHING MORE WORD STARTS THAN THIS HAVE THEIR TOP
+# COMPLETIONS PRECOMPUTED; SMALLER RANGES ARE RANKED WHEN ASKED FOR
+PREFIX_SCAN_LIMIT = 256
+
+
+def normalise_title(text):
+    """
+    Casefolds text and strips accents so that e.g. "Amélie" and
+    "AMELIE" compare equal.
+
+    Args:
+        text (str): Title or search query
+
+    Returns:
+        str: Normalised text
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed
+                   if not unicodedata.combining(char))
+
+
+def ngrams(text):
+    """
+    Returns:
+        set: Unique n-grams of the text.
+    """
+    return {text[i:i + NGRAM_SIZE]
+            for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class TitleIndex:
+    def __init__(self, store):
+        """
+        Trigram inverted index over the normalised titles of a
+        MovieStore.
+
+        Attributes:
+            pool (str): Normalised titles, each followed by a separator.
+            offsets (array): Start offset of each title in the pool, plus
+            a final end offset.
+            postings (dict): Maps each trigram to an ascending array of
+            row numbers whose title contains it.
+        """
+        self.offsets = array("I", [0])
+        self.postings = {}
+        titles = []
+        for row in range(len(store)):
+            title = normalise_title(store.title(row))
+            titles.append(title + TITLE_SEPARATOR)
+            self.offsets.append(self.offsets[-1] + len(title) + 1)
+            for gram in ngrams(title):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array("I")
+                posting.append(row)
+        self.pool = "".join(titles)
+
+    def title(self, row):
+        """
+        Returns:
+            str: Normalised title of a row.
+        """
+        return self.pool[self.offsets[row]:self.offsets[row + 1] - 1]
+
+    def search(self, query):
+        """
+        Finds all titles containing the query, ignoring case and accents.
+
+        Args:
+            query (str): Search query
+
+        Returns:
+            list: Ascending row numbers of matching titles.
+        """
+        query = normalise_title(query).replace(TITLE_SEPARATOR, "")
+        if not query:
+            return list(range(len(self.offsets) - 1))
+        if len(query) < NGRAM_SIZE:
+            return self.scan(query)
+
+        # INTERSECT POSTING LISTS, SMALLEST FIRST
+        postings = []
+        for gram in ngrams(query):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if len(candidates) <= VERIFY_LIMIT:
+                break
+            candidates = set(candidates).intersection(posting)
+
+        # VERIFY CANDIDATES AGAINST FULL QUERY
+        return sorted(row for row in candidates if query in self.title(row))
+
+    def fuzzy_search(self, query, votes, k=20):
+        """
+        Finds the titles closest to a query that may be misspelt, e.g.
+        "inceptoin" or "lord of the rnigs".
+
+        A title's similarity is the share of the query's trigrams it
+        contains, so a title containing the whole query scores 1.
+        Trigrams are counted straight from the posting lists, rarest
+        first, until FUZZY_POSTINGS_BUDGET entries have been read.
+
+        Args:
+            query (str): Search query
+            votes (array): Number of votes of each movie, which weights
+            the ranking towards well-known movies
+            k (int): Most results to return
+
+        Returns:
+            list: Row numbers of up to k titles with a similarity of at
+            least MIN_SIMILARITY, best first, ranked by similarity
+            times the log of the movie's votes.
+        """
+        query = normalise_title(query).replace(TITLE_SEPARATOR, "")
+        if len(query) < NGRAM_SIZE:
+            return self.search(query)[:k]
+
+        postings = sorted((self.postings[gram] for gram in ngrams(query)
+                           if gram in self.postings), key=len)
+        grams = len(ngrams(query))
+        counts = Counter()
+        read = 0
+        for position, posting in enumerate(postings):
+            if read and read + len(posting) > FUZZY_POSTINGS_BUDGET:
+                # LEAVE OUT SKIPPED TRIGRAMS RATHER THAN PENALISE EVERY
+                # TITLE FOR THEM
+                grams -= len(postings) - position
+                break
+            counts.update(posting)
+            read += len(posting)
+
+        needed = MIN_SIMILARITY * grams
+        return heapq.nlargest(
+            k,
+            (row for row, count in counts.items() if count >= needed),
+            key=lambda row: (counts[row] * math.log10(10 + votes[row]),
+                             -row),
+        )
+
+    def estimate(self, query):
+        """
+        Returns:
+            int: Upper bound on the number of titles matching the query,
+            from the size of its rarest trigram's posting list.
+        """
+        query = normalise_title(query)
+        if len(query) < NGRAM_SIZE:
+            return len(self.offsets) - 1
+        return min(len(self.postings.get(gram, ())) for gram in ngrams(query))
+
+    def scan(self, query):
+        """
+        Finds titles containing a query too short to have n-grams by
+        searching the whole title pool.
+
+        Returns:
+            list: Ascending row numbers of matching titles.
+        """
+        rows = []
+        position = self.pool.find(query)
+        while position != -1:
+            row = bisect_right(self.offsets, position) - 1
+            rows.append(row)
+            # SKIP TO NEXT TITLE
+            position = self.pool.find(query, self.offsets[row + 1])
+        return rows
+
+
+class PrefixIndex:
+    def __init__(self, title_index, store):
+        """
+        Autocomplete index over the start of every word of every
+        normalised title, so "lord" and "fellowship" both complete to
+        "The Lord of the Rings: The Fellowship of the Ring".
+
+        Word starts are kept as offsets into the TitleIndex title pool,
+        sorted by the rest of the title from there, so all the word
+        starts beginning with a prefix form one range found by binary
+        search. The most voted movies are precomputed for every prefix
+        whose range is larger than PREFIX_SCAN_LIMIT.
+
+        Args:
+            title_index (TitleIndex): Index holding the normalised titles
+            store (MovieStore): Store the titles come from, whose votes
+            rank the completions
+
+        Attributes:
+            pool (str): The TitleIndex title pool
+            starts (array): Pool offset of each word start, sorted by the
+            text from there to the end of its title
+            rows (array): Row number of the movie for each word start
+            tops (dict): Maps each prefix with a large range to its most
+            voted row numbers, best first
+        """
+        self.pool = title_index.pool
+        self.store = store
+        starts = []
+        for row in range(len(title_index.offsets) - 1):
+            start = title_index.offsets[row]
+            title = title_index.title(row)
+            for position, char in enumerate(title):
+                if char.isalnum() and (position == 0
+                                       or not title[position - 1].isalnum()):
+                    starts.append(start + position)
+        starts.sort(key=self.rest_of_title)
+        self.starts = array("I", starts)
+        self.rows = array("I", (bisect_right(title_index.offsets, start) - 1
+                                for start in starts))
+        self.tops = {}
+        self.precompute_tops()
+
+    def rest_of_title(self, start):
+        return self.pool[start:self.pool.index(TITLE_SEPARATOR, start)]
+
+    def bounds(self, prefix, low=0, high=None):
+        """
+        Finds the word starts beginning with a normalised prefix. A
+        range found for a shorter prefix can be passed in to narrow it.
+
+        Returns:
+            tuple: Start and end of the range in starts
+        """
+        if high is None:
+            high = len(self.starts)
+
+        def key(start):
+            # TEXT PAST THE END OF A TITLE STARTS WITH THE SEPARATOR,
+            # WHICH SORTS FIRST, SO TRUNCATED KEYS KEEP THE SORT ORDER
+            return self.pool[start:start + len(prefix)]
+
+        low = bisect_left(self.starts, prefix, low, high, key=key)
+        high = bisect_right(self.starts, prefix, low, high, key=key)
+        return low, high
+
+    def most_voted(self, rows, n):
+        votes = self.store.votes
+        return heapq.nlargest(n, set(rows),
+                              key=lambda row: (votes[row], -row))
+
+    def precompute_tops(self, prefix="", low=0, high=None):
+        """
+        Precomputes the most voted movies for a prefix and every longer
+        prefix whose range is larger than PREFIX_SCAN_LIMIT. Each one is
+        ranked from its children's top movies and the word starts of its
+        smaller children, so every word start is ranked only once.
+
+        Returns:
+            list: Most voted row numbers for the prefix, best first
+        """
+        if high is None:
+            high = len(self.starts)
+        depth = len(prefix)
+        candidates = []
+        while low < high:
+            start = self.starts[low]
+            child = self.pool[start:start + depth + 1]
+            child_low, child_high = self.bounds(child, low, high)
+            if (child_high - child_low > PREFIX_SCAN_LIMIT
+                    and not child.endswith(TITLE_SEPARATOR)):
+                candidates.extend(self.precompute_tops(child, child_low,
+                                                       child_high))
+            else:
+                candidates.extend(self.rows[child_low:child_high])
+            low = child_high
+        top = self.most_voted(candidates, PREFIX_TOP_N)
+        self.tops[prefix] = top
+        return top
+
+    def complete(self, prefix, n=PREFIX_TOP_N):
+        """
+        Finds the most voted movies with a title word starting with a
+        prefix, ignoring case and accents.
+
+        Args:
+            prefix (str): Start of a title or of any word in it
+            n (int): Most completions to return, up to PREFIX_TOP_N
+
+        Returns:
+            list: Row numbers of the movies, most votes first.
+        """
+        prefix = normalise_title(prefix).lstrip().replace(TITLE_SEPARATOR,
+                                                          "")
+        top = self.tops.get(prefix)
+        if top is not None:
+            return top[:n]
+        low, high = self.bounds(prefix)
+        return self.most_voted(self.rows[low:high], n)
+
+
+class GenreIndex:
+    def __init__(self, store):
+        """
+        Genre catalogue and per-genre posting lists of a MovieStore.
+
+        Attributes:
+            names (list): Genre names in order of first appearance in
+            the dataset.
+            postings (list): Ascending array of row numbers for each
+            genre, in the same order as names.
+        """
+        self.store = store
+        self.names = list(store.genre_names)
+        self.postings = [array("I") for _ in self.names]
+        for row, mask in enumerate(store.genre_masks):
+            genre_id = 0
+            while mask:
+                if mask & 1:
+                    self.postings[genre_id].append(row)
+                mask >>= 1
+                genre_id += 1
+
+    def mask(self, genres):
+        """
+        Returns:
+            int: Bitmask of the named genres.
+
+        Raises:
+            KeyError: Genre not in the dataset
+        """
+        mask = 0
+        for genre in genres:
+            mask |= 1 << self.store.genre_ids[genre]
+        return mask
+
+    def rows(self, genre):
+        """
+        Returns:
+            array: Ascending row numbers of movies in the genre.
+        """
+        return self.postings[self.store.genre_ids[genre]]
+
+    def select(self, all_of=(), any_of=(), none_of=()):
+        """
+        Finds movies matching a combination of genres.
+
+        Args:
+            all_of (iterable): Genres a movie must have every one of
+            any_of (iterable): Genres a movie must have at least one of
+            none_of (iterable): Genres a movie must not have
+
+        Returns:
+            list: Ascending row numbers of matching movies.
+
+        Raises:
+            KeyError: Genre not in the dataset
+        """
+        all_mask = self.mask(all_of)
+        any_mask = self.mask(any_of)
+        none_mask = self.mask(none_of)
+        masks = self.store.genre_masks
+
+        # START FROM THE SMALLEST POSTING LIST THAT EVERY MATCH IS IN
+        if all_of:
+            candidates = min((self.rows(genre) for genre in all_of), key=len)
+        elif any_of:
+            candidates = dedupe(heapq.merge(
+                *(self.rows(genre) for genre in any_of)))
+        else:
+            candidates = range(len(masks))
+
+        return [row for row in candidates
+                if masks[row] & all_mask == all_mask
+                and (not any_mask or masks[row] & any_mask)
+                and not masks[row] & none_mask]
+
+
+class RangeIndex:
+    def __init__(self, column):
+        """
+        Sorted index over one numeric column of a MovieStore, for
+        answering range queries by binary search.
+
+        Attributes:
+            order (array): Row numbers sorted by value, ties in row order.
+            values (array): Column values in the same sorted order.
+        """
+        rows = sorted(range(len(column)), key=column.__getitem__)
+        self.order = array("I", rows)
+        # ARRAY COLUMNS HAVE A typecode, MEMORY-MAPPED ONES A format
+        typecode = getattr(column, "typecode", None) or column.format
+        self.values = array(typecode, (column[row] for row in rows))
+
+    def min(self):
+        return self.values[0] if self.values else None
+
+    def max(self):
+        return self.values[-1] if self.values else None
+
+    def between(self, low=None, high=None):
+        """
+        Finds movies whose value is within an inclusive range.
+
+        Args:
+            low (int): Lowest value to include, or None for no lower bound
+            high (int): Highest value to include, or None for no upper bound
+
+        Returns:
+            array: Row numbers of matching movies, ordered by value.
+        """
+        start = 0 if low is None else bisect_left(self.values, low)
+        end = (len(self.values) if high is None
+               else bisect_right(self.values, high))
+        return self.order[start:end]
+
+    def count(self, low=None, high=None):
+        """
+        Returns:
+            int: Number of movies whose value is within the range.
+        """
+        start = 0 if low is None else bisect_left(self.values, low)
+        end = (len(self.values) if high is None
+               else bisect_right(self.values, high))
+        return max(end - start, 0)
+
+
+def range_indexes(store):
+    """
+    Builds a RangeIndex for each numeric column of a MovieStore.
+
+    Returns:
+        dict: RangeIndex for "year", "runtime", "rating" (in tenths)
+        and "votes".
+    """
+    return {
+        "year": RangeIndex(store.years),
+        "runtime": RangeIndex(store.runtimes),
+        "rating": RangeIndex(store.ratings),
+        "votes": RangeIndex(store.votes),
+    }
+
+
+def dedupe(rows):
+    """
+    Yields each row once from an ascending iterable of rows.
+    """
+    previous = None
+    for row in rows:
+        if row != previous:
+            yield row
+            previous = row
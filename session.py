@@ -0,0 +1,186 @@
+# USER SESSION STATE
+import shutil
+import sys
+
+from list_journal import ADD, REMOVE
+from movie_store import CustomList
+
+TERM_COLS = 80  # DEFAULT TERMINAL SIZE WHEN IT CAN'T BE DETECTED
+TERM_ROWS = 24
+LIST_NAMES = ("favourites", "watchlist")  # LISTS KEPT FOR EACH USER
+
+
+class Session:
+    def __init__(self, stdin=None, stdout=None, columns=None, rows=None,
+                 user=None, journal=None, catalogue=None):
+        """
+        Represents one user's session. Everything that belongs to a
+        single user lives here rather than in module globals, so many
+        sessions can share one loaded catalogue.
+
+        Args:
+            stdin: Text stream to read input from; defaults to the
+            process's terminal
+            stdout: Text stream to write output to; defaults to the
+            process's terminal
+            columns (int): Terminal width; detected if not given
+            rows (int): Terminal height; detected if not given
+            user (str): Name the user's lists are saved under; None
+            until asked, "" to keep them for this session only
+            journal (ListJournal): Where the user's lists are saved
+            catalogue (Catalogue): Catalogue the session's screens and
+            lists use; moved onto a reloaded one between screens
+
+        Attributes:
+            favourites (CustomList): User-selected favourite movies
+            watchlist (CustomList): User-selected movies to watch later
+        """
+        self.stdin = stdin
+        self.stdout = stdout
+        self.columns = columns
+        self.rows = rows
+        self.user = user
+        self.journal = journal
+        self.catalogue = catalogue
+        self._lists = None
+
+    @property
+    def favourites(self):
+        return self.saved_list("favourites")
+
+    @property
+    def watchlist(self):
+        return self.saved_list("watchlist")
+
+    def saved_list(self, name):
+        """
+        Returns one of the user's lists, loading the user's saved lists
+        on first access.
+        """
+        if self._lists is None:
+            self._lists = {list_name: CustomList()
+                           for list_name in LIST_NAMES}
+            if self.user and self.journal is not None:
+                for list_name, keys in self.journal.load(self.user).items():
+                    if list_name in self._lists:
+                        find_movie = self.find_saved(list_name,
+                                                     self.catalogue)
+                        self._lists[list_name].add(
+                            movie for movie in map(find_movie, keys)
+                            if movie is not None
+                        )
+        return self._lists[name]
+
+    def remap_lists(self, catalogue):
+        """
+        Points the user's lists at the movies of a reloaded catalogue,
+        matching them by key. Movies the catalogue no longer has are
+        left out of the lists but kept in the journal, so they come back
+        if a later dataset has them again.
+        """
+        for name, custom_list in (self._lists or {}).items():
+            custom_list.remap(self.find_saved(name, catalogue))
+
+    def find_saved(self, name, catalogue):
+        """
+        Returns:
+            function: Maps the key of a movie in one of the user's
+            lists to the movie in a catalogue, or None. Movies found by
+            a (title, year) key, saved before the dataset had a tconst
+            column, are saved again under their tconst.
+        """
+        def find_movie(key):
+            movie = catalogue.find_movie(key)
+            if (movie is not None and movie.key != key
+                    and self.user and self.journal is not None):
+                # IN LIST ORDER, SO THE REPLAYED LIST KEEPS ITS ORDER
+                self.journal.record(self.user, REMOVE, name, key)
+                self.journal.record(self.user, ADD, name, movie.key)
+            return movie
+        return find_movie
+
+    def list_name(self, custom_list):
+        for name, movies in (self._lists or {}).items():
+            if movies is custom_list:
+                return name
+        raise ValueError("Not one of this session's lists")
+
+    def add_to_list(self, custom_list, movies):
+        """
+        Appends movies to one of the user's lists, skipping any already
+        in it, and saves the change in the background.
+
+        Returns:
+            list: The movies added
+        """
+        added = custom_list.add(movies)
+        self.save_changes(ADD, custom_list, added)
+        return added
+
+    def remove_from_list(self, custom_list, positions):
+        """
+        Removes movies from one of the user's lists and saves the
+        change in the background.
+
+        Args:
+            custom_list (CustomList): List to remove from
+            positions (list): Positions of the movies, starting from 0
+
+        Raises:
+            IndexError: No movie at one of the positions
+
+        Returns:
+            list: The movies removed
+        """
+        removed = custom_list.remove([custom_list[position]
+                                      for position in positions])
+        self.save_changes(REMOVE, custom_list, removed)
+        return removed
+
+    def save_changes(self, op, custom_list, movies):
+        if self.user and self.journal is not None:
+            name = self.list_name(custom_list)
+            for movie in movies:
+                self.journal.record(self.user, op, name, movie.key)
+
+    def terminal_size(self):
+        """
+        Returns:
+            tuple: Terminal (columns, rows) of this session.
+        """
+        if self.columns and self.rows:
+            return self.columns, self.rows
+        size = shutil.get_terminal_size(fallback=(TERM_COLS, TERM_ROWS))
+        return self.columns or size.columns, self.rows or size.lines
+
+    def input(self, prompt=""):
+        """
+        Shows a prompt and reads one line of input.
+
+        Raises:
+            EOFError: Input closed
+
+        Returns:
+            str: Line entered, without the line ending
+        """
+        if self.stdin is None:
+            return input(prompt)
+        self.write(prompt)
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip("\r\n")
+
+    def print(self, *values, sep=" ", end="\n"):
+        """
+        Prints values like the built-in print().
+        """
+        self.write(sep.join(str(value) for value in values) + end)
+
+    def write(self, text):
+        """
+        Writes text to the session's terminal in a single write.
+        """
+        stdout = self.stdout or sys.stdout
+        stdout.write(text)
+        stdout.flush()
@@ -0,0 +1,231 @@
+# PREFORK SESSION SERVER
+# Loads the dataset once, then forks a pre-loaded session per connection.
+# Usage: python3 session_server.py /tmp/cinemate.sock
+import fcntl
+import gc
+import os
+import pty
+import select
+import signal
+import socket
+import struct
+import sys
+import termios
+import time
+
+import run
+
+# TERMINAL SIZE - MATCHES PTY OPTIONS IN controllers/default.js
+TERM_NAME = "xterm-color"
+TERM_COLS = 80
+TERM_ROWS = 24
+BUFFER_SIZE = 4096
+
+
+# SET WINDOW SIZE OF SESSION PTY
+def set_window_size(fd, rows=TERM_ROWS, cols=TERM_COLS):
+    """
+    Sets the terminal window size on the master side of a pty.
+
+    Args:
+        fd (int): Master file descriptor of the pty
+        rows (int): Number of rows
+        cols (int): Number of columns
+    """
+    winsize = struct.pack("HHHH", rows, cols, 0, 0)
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
+
+
+# RELAY BYTES BETWEEN CLIENT SOCKET AND SESSION PTY
+def relay(conn, master_fd):
+    """
+    Copies terminal input from the client to the pty and terminal
+    output from the pty back to the client until either side closes.
+
+    Args:
+        conn (socket.socket): Connected client socket
+        master_fd (int): Master file descriptor of the session pty
+    """
+    while True:
+        readable, _, _ = select.select([conn, master_fd], [], [])
+        if conn in readable:
+            data = conn.recv(BUFFER_SIZE)
+            if not data:
+                return
+            os.write(master_fd, data)
+        if master_fd in readable:
+            try:
+                data = os.read(master_fd, BUFFER_SIZE)
+            except OSError:
+                # SESSION EXITED AND PTY CLOSED
+                return
+            if not data:
+                return
+            conn.sendall(data)
+
+
+# RUN ONE FORKED SESSION
+def serve_connection(conn):
+    """
+    Runs in a forked child. Starts the session on a new pty in a
+    grandchild and relays it over the client connection. Both
+    processes share the parent's loaded dataset copy-on-write.
+    SIGUSR1 from the parent after a reload is passed on to the
+    session, which loads the new snapshot at its next screen.
+
+    Args:
+        conn (socket.socket): Connected client socket
+    """
+    pid, master_fd = pty.fork()
+    if pid == 0:
+        # SESSION PROCESS - STDIN/STDOUT ARE NOW THE PTY
+        conn.close()
+        os.environ["TERM"] = TERM_NAME
+        try:
+            run.run_session()
+        except (EOFError, KeyboardInterrupt, OSError):
+            pass
+        finally:
+            sys.stdout.flush()
+            os._exit(0)
+
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: os.kill(pid, signal.SIGUSR1))
+    set_window_size(master_fd)
+    try:
+        relay(conn, master_fd)
+    except OSError:
+        pass
+    finally:
+        # CLIENT GONE OR SESSION FINISHED - TIDY UP BOTH SIDES
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        os.close(master_fd)
+        conn.close()
+
+
+# RELOAD THE DATASET FOR NEW AND RUNNING SESSIONS
+def reload_sessions(sessions):
+    """
+    Reloads the catalogue if the dataset has changed or SIGUSR1 was
+    received. New sessions are forked from the new catalogue, and
+    running ones are sent SIGUSR1 to load its snapshot.
+
+    Args:
+        sessions (set): Process IDs of running sessions
+    """
+    force = run.reload_requested.is_set()
+    run.reload_requested.clear()
+    if not run.reload_catalogue(force):
+        return
+    run.catalogue.wait(*run.LOAD_STAGES)
+    gc.collect()
+    gc.freeze()
+    for pid in sessions:
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
+
+
+# FORGET FINISHED SESSIONS
+def reap_sessions(sessions):
+    """
+    Collects exited sessions. Until collected, a session's process ID
+    can't be reused, so sessions can be signalled safely.
+
+    Args:
+        sessions (set): Process IDs of running sessions
+    """
+    while sessions:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            sessions.clear()
+            return
+        if pid == 0:
+            return
+        sessions.discard(pid)
+
+
+# ACCEPT CONNECTIONS AND FORK A SESSION FOR EACH
+def serve(socket_path):
+    """
+    Loads the dataset once and forks a session per connection on
+    a unix socket. The dataset is checked for changes between
+    connections, on this thread, so a fork never happens partway
+    through a reload.
+
+    Args:
+        socket_path (str): File path of the unix socket to listen on
+    """
+    run.load_catalogue()
+    # READ EVERY PART OF THE SNAPSHOT NOW, SO SESSIONS SHARE THEM
+    # COPY-ON-WRITE RATHER THAN EACH READING ITS OWN
+    run.catalogue.wait(*run.LOAD_STAGES)
+
+    # MOVE LOADED OBJECTS OUT OF GC TRACKING SO CHILDREN DON'T
+    # DIRTY SHARED PAGES WHEN THE COLLECTOR RUNS
+    gc.collect()
+    gc.freeze()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+    server.setblocking(False)
+
+    # SIGNALS WAKE THE ACCEPT LOOP: SIGUSR1 TO RELOAD AT ONCE, SIGCHLD
+    # TO COLLECT A FINISHED SESSION
+    wake_reader, wake_writer = socket.socketpair()
+    wake_writer.setblocking(False)
+    signal.set_wakeup_fd(wake_writer.fileno())
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: run.reload_requested.set())
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    print(f"CineMate session server listening on {socket_path}")
+    sys.stdout.flush()
+
+    sessions = set()
+    next_check = time.monotonic() + run.RELOAD_CHECK_INTERVAL
+    while True:
+        readable, _, _ = select.select([server, wake_reader], [], [],
+                                       run.RELOAD_CHECK_INTERVAL)
+        if wake_reader in readable:
+            wake_reader.recv(BUFFER_SIZE)
+        reap_sessions(sessions)
+        if (run.reload_requested.is_set()
+                or time.monotonic() >= next_check):
+            reload_sessions(sessions)
+            next_check = time.monotonic() + run.RELOAD_CHECK_INTERVAL
+        if server not in readable:
+            continue
+        try:
+            conn, _ = server.accept()
+        except (BlockingIOError, InterruptedError):
+            continue
+        conn.setblocking(True)
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            signal.set_wakeup_fd(-1)
+            wake_reader.close()
+            wake_writer.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                serve_connection(conn)
+            finally:
+                os._exit(0)
+        sessions.add(pid)
+        conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python3 session_server.py SOCKET_PATH")
+        sys.exit(1)
+    serve(sys.argv[1])
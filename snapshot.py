@@ -0,0 +1,246 @@
+# STARTUP SNAPSHOT CACHE
+# Saves the fully built in-memory state next to the dataset so later
+# launches can load it instead of re-parsing the tsv. Each part of the
+# state is pickled separately, so a process reads only the parts its
+# screens use, when they first use them.
+# Layout:
+#   SNAPSHOT_MAGIC
+#   key (SNAPSHOT_KEY): snapshot version, and the size, modified time
+#   and SHA-256 digest of the dataset the state was built from
+#   contents offset (8 bytes, little-endian)
+#   each part, pickled
+#   contents, pickled: offset and length of each part
+import hashlib
+import io
+import os
+import pickle
+import struct
+
+SNAPSHOT_MAGIC = b"CINEMATE-SNAPSHOT"
+# BUMP WHEN THE STRUCTURES SAVED IN A SNAPSHOT CHANGE
+SNAPSHOT_VERSION = 13
+SNAPSHOT_KEY = struct.Struct("<IQq32s")
+CONTENTS_OFFSET = struct.Struct("<Q")
+PARTS_START = len(SNAPSHOT_MAGIC) + SNAPSHOT_KEY.size + CONTENTS_OFFSET.size
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def snapshot_path(dataset):
+    """
+    Returns:
+        str: File path of the snapshot for a dataset.
+    """
+    return dataset + ".snapshot"
+
+
+def file_hash(f):
+    """
+    Args:
+        f: File opened in binary mode, positioned at the start
+
+    Returns:
+        bytes: SHA-256 digest of the file's contents.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.digest()
+
+
+# IDENTIFY A VERSION OF A FILE
+def file_key(path):
+    """
+    Reads the size, modified time and content hash of a file, all from
+    the same open file, so they describe one version of it even if it
+    is replaced meanwhile. Take the key before reading the file to
+    build anything from it: if the file is replaced in between, the
+    key is older than the data, and the data is rebuilt next time.
+
+    Args:
+        path (str): File path
+
+    Raises:
+        OSError: File can't be read
+
+    Returns:
+        tuple: Size, modified time in nanoseconds and SHA-256 digest
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        return stat.st_size, stat.st_mtime_ns, file_hash(f)
+
+
+def key_matches(key, path):
+    """
+    Checks a key against the current version of a file. A key matches
+    when the file's size and modified time are the same, or when only
+    the modified time differs but the content hash is the same.
+
+    Args:
+        key (tuple): Key from file_key()
+        path (str): File path
+
+    Returns:
+        tuple: Whether the key matches, and the file's current key if
+        it matches only by hash (so the stored key can be updated),
+        otherwise None
+    """
+    size, mtime, digest = key
+    try:
+        stat = os.stat(path)
+        if stat.st_size != size:
+            return False, None
+        if stat.st_mtime_ns == mtime:
+            return True, None
+        # FILE TOUCHED OR COPIED - ONLY STALE IF CONTENT CHANGED
+        current = file_key(path)
+    except OSError:
+        return False, None
+    if current[0] != size or current[2] != digest:
+        return False, None
+    return True, current
+
+
+class PartPickler(pickle.Pickler):
+    def __init__(self, file, references):
+        """
+        Pickles one part of a snapshot. Objects that belong to other
+        parts are saved as references, resolved when the part is read,
+        so they are neither copied nor read along with it.
+
+        Args:
+            file: File opened in binary mode to write to
+            references (dict): Maps the id of each object from another
+            part to its reference name
+        """
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.references = references
+
+    def persistent_id(self, obj):
+        return self.references.get(id(obj))
+
+
+class Snapshot:
+    def __init__(self, file, contents):
+        """
+        An open snapshot whose parts are read as they are needed.
+
+        Parts are read with os.pread, so threads and forked processes
+        can share the file, and a snapshot replaced meanwhile doesn't
+        change the parts still to be read.
+
+        Args:
+            file: Snapshot file opened in binary mode
+            contents (dict): Maps each part's name to its offset and
+            length in the file
+        """
+        self.file = file
+        self.contents = contents
+
+    def load(self, name, resolve):
+        """
+        Args:
+            name (str): Part to read
+            resolve (function): Returns the object a reference name
+            saved in the part stands for
+
+        Raises:
+            KeyError: No such part
+
+        Returns:
+            object: The part
+        """
+        offset, length = self.contents[name]
+        unpickler = pickle.Unpickler(
+            io.BytesIO(os.pread(self.file.fileno(), length, offset)))
+        unpickler.persistent_load = resolve
+        return unpickler.load()
+
+
+def load_snapshot(dataset):
+    """
+    Opens the snapshot for a dataset if it is still valid. If only the
+    dataset's modified time has changed, the snapshot's key is updated
+    so later launches don't hash the dataset again.
+
+    Args:
+        dataset (str): File path of the dataset.
+
+    Returns:
+        Snapshot: The open snapshot, or None if missing, stale or
+        unreadable.
+    """
+    path = snapshot_path(dataset)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    try:
+        start = f.read(PARTS_START)
+        if not start.startswith(SNAPSHOT_MAGIC) or len(start) < PARTS_START:
+            raise ValueError(f"{path} is not a snapshot")
+        version, *key = SNAPSHOT_KEY.unpack_from(start, len(SNAPSHOT_MAGIC))
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version in {path}")
+        matches, current = key_matches(key, dataset)
+        if not matches:
+            raise ValueError(f"{path} is out of date")
+        (contents_offset,) = CONTENTS_OFFSET.unpack_from(
+            start, len(SNAPSHOT_MAGIC) + SNAPSHOT_KEY.size)
+        f.seek(contents_offset)
+        contents = pickle.load(f)
+    except Exception:
+        f.close()
+        return None
+
+    if current is not None:
+        try:
+            with open(path, "r+b") as key_file:
+                # THE KEY HAS A FIXED SIZE, SO IT IS REWRITTEN IN PLACE
+                os.pwrite(key_file.fileno(),
+                          SNAPSHOT_KEY.pack(SNAPSHOT_VERSION, *current),
+                          len(SNAPSHOT_MAGIC))
+        except OSError:
+            pass
+    return Snapshot(f, contents)
+
+
+def save_snapshot(dataset, key, parts, shared):
+    """
+    Writes the state for a dataset to its snapshot file. The file is
+    replaced atomically so concurrent launches never read a partial
+    snapshot. Failures are ignored as the snapshot is only a cache.
+
+    Args:
+        dataset (str): File path of the dataset.
+        key (tuple): file_key() of the dataset, taken before the
+        state was built from it
+        parts (dict): Maps each part's name to a picklable object
+        shared (dict): Maps the reference name of each object used by
+        more than one part to the name of the part it belongs to and
+        the object; other parts save it as a reference
+    """
+    path = snapshot_path(dataset)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(SNAPSHOT_KEY.pack(SNAPSHOT_VERSION, *key))
+            f.write(CONTENTS_OFFSET.pack(0))
+            contents = {}
+            for name, part in parts.items():
+                offset = f.tell()
+                references = {id(obj): reference for reference, (owner, obj)
+                              in shared.items() if owner != name}
+                PartPickler(f, references).dump(part)
+                contents[name] = (offset, f.tell() - offset)
+            contents_offset = f.tell()
+            pickle.dump(contents, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.seek(len(SNAPSHOT_MAGIC) + SNAPSHOT_KEY.size)
+            f.write(CONTENTS_OFFSET.pack(contents_offset))
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass